@@ -37,7 +37,33 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///appointments.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool shared by web requests, the scheduler and its job store
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # ms
 app.config['JSON_AS_ASCII'] = False  # Enable UTF-8 in JSON responses
+# Reminder scheduling: 'sweeper' (one recurring batch job) or 'jobs' (one job per appointment)
+app.config['REMINDER_MODE'] = os.getenv('REMINDER_MODE', 'sweeper')
+app.config['REMINDER_SWEEP_INTERVAL'] = int(os.getenv('REMINDER_SWEEP_INTERVAL', 60))
+app.config['REMINDER_RECONCILE_INTERVAL'] = int(os.getenv('REMINDER_RECONCILE_INTERVAL', 300))
+# SMS outbox dispatcher
+app.config['SMS_OUTBOX_INTERVAL'] = int(os.getenv('SMS_OUTBOX_INTERVAL', 10))
+app.config['SMS_OUTBOX_BATCH_SIZE'] = int(os.getenv('SMS_OUTBOX_BATCH_SIZE', 100))
+app.config['SMS_OUTBOX_CONCURRENCY'] = int(os.getenv('SMS_OUTBOX_CONCURRENCY', 4))
+# Seconds before a claimed batch is re-queued; 0 = twice its worst-case send time
+app.config['SMS_OUTBOX_CLAIM_TIMEOUT'] = int(os.getenv('SMS_OUTBOX_CLAIM_TIMEOUT', 0))
+app.config['SMS_OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('SMS_OUTBOX_MAX_ATTEMPTS', 5))
+app.config['SMS_RETRY_BASE_DELAY'] = int(os.getenv('SMS_RETRY_BASE_DELAY', 60))
+app.config['SMS_RETRY_MAX_DELAY'] = int(os.getenv('SMS_RETRY_MAX_DELAY', 3600))
+app.config['SMS_ROLLUP_INTERVAL'] = int(os.getenv('SMS_ROLLUP_INTERVAL', 300))
+# Scheduler process role: 'auto'/'worker' join the leader election, 'off' never runs the scheduler
+app.config['SCHEDULER_ROLE'] = os.getenv('SCHEDULER_ROLE', 'auto')
+app.config['SCHEDULER_LEASE_TTL'] = int(os.getenv('SCHEDULER_LEASE_TTL', 30))
 # Mail config
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
@@ -52,7 +78,19 @@ moment = Moment(app)
 
 # Initialize extensions
 from models import db, User, Appointment, BlockedDay, Client, SmsLog
+from sqlalchemy import event
 db.init_app(app)
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """WAL lets readers run during writes; busy_timeout makes writers wait instead of failing"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', _configure_sqlite_connection)
 migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
 login_manager = LoginManager()
@@ -61,12 +99,12 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Bu sayfaya erişmek için giriş yapmalısınız.'
 login_manager.login_message_category = 'info'
 
-# Initialize scheduler service
-from services.scheduler_service import SchedulerService
+# Scheduler service; APScheduler is only imported by the elected process
 scheduler_service = None
+leader_elector = None
 
 def get_scheduler_service():
-    """Get the scheduler service instance"""
+    """Get the scheduler service instance (None unless this process is the leader)"""
     return scheduler_service
 
 # Import routes after models are initialized
@@ -101,30 +139,60 @@ def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html'), 500
 
-def init_scheduler():
-    """Initialize and start the scheduler service"""
-    global scheduler_service
+def init_scheduler(role=None):
+    """Join the scheduler leader election; only the elected process runs reminders"""
+    global leader_elector
+    role = role or app.config['SCHEDULER_ROLE']
+    if role == 'off':
+        app.logger.info("Scheduler disabled in this process (SCHEDULER_ROLE=off)")
+        return
+    if leader_elector:
+        return
     try:
-        scheduler_service = SchedulerService(db, app)
-        scheduler_service.start()
-        
-        # Schedule all pending reminders
-        with app.app_context():
-            scheduler_service.schedule_all_pending_reminders()
-        
-        app.logger.info("Scheduler service initialized and started")
+        from services.leader_election import LeaderElector
+        leader_elector = LeaderElector(
+            db, app,
+            ttl=app.config['SCHEDULER_LEASE_TTL'],
+            on_elected=_start_scheduler,
+            on_demoted=_stop_scheduler
+        )
+        leader_elector.start()
     except Exception as e:
         app.logger.error(f"Failed to initialize scheduler: {str(e)}")
 
-def shutdown_scheduler():
-    """Stop the scheduler service"""
+def _start_scheduler():
+    """Start the scheduler service once this process is elected leader"""
     global scheduler_service
-    if scheduler_service:
-        try:
-            scheduler_service.stop()
-            app.logger.info("Scheduler service stopped")
-        except Exception as e:
-            app.logger.error(f"Failed to stop scheduler: {str(e)}")
+    from services.scheduler_service import SchedulerService
+    service = SchedulerService(db, app)
+    service.start()
+    
+    # Schedule all pending reminders
+    with app.app_context():
+        service.schedule_all_pending_reminders()
+    
+    scheduler_service = service
+    app.logger.info("Scheduler service initialized and started")
+
+def _stop_scheduler():
+    """Stop the scheduler service when leadership is lost"""
+    global scheduler_service
+    service, scheduler_service = scheduler_service, None
+    if service:
+        service.stop()
+        app.logger.info("Scheduler service stopped")
+
+def shutdown_scheduler():
+    """Leave the leader election and stop the scheduler service"""
+    global leader_elector
+    try:
+        if leader_elector:
+            leader_elector.stop()
+            leader_elector = None
+        else:
+            _stop_scheduler()
+    except Exception as e:
+        app.logger.error(f"Failed to stop scheduler: {str(e)}")
 
 
 
@@ -0,0 +1,13 @@
+# Gunicorn configuration
+# Every worker joins the scheduler leader election; exactly one of them
+# (or a dedicated process, see SCHEDULER_ROLE) runs the reminder scheduler.
+
+
+def post_worker_init(worker):
+    from app import init_scheduler
+    init_scheduler()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_scheduler
+    shutdown_scheduler()
@@ -4,22 +4,41 @@ Management script for the scheduler service
 """
 import os
 import sys
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app, db, get_scheduler_service
-from model_definitions import create_models
+from models import Appointment
+
+@contextmanager
+def scheduler_service():
+    """
+    Scheduler service to run one command against
+
+    The scheduler normally runs only in the elected leader process, which
+    is never this one. Commands therefore open the shared job store through
+    a local scheduler started paused: jobs are read and written in the
+    database, but nothing is executed here.
+    """
+    service = get_scheduler_service()
+    if service:
+        yield service
+        return
+
+    from services.scheduler_service import SchedulerService
+    service = SchedulerService(db, app)
+    service.scheduler.start(paused=True)
+    try:
+        yield service
+    finally:
+        service.scheduler.shutdown(wait=False)
 
 def list_scheduled_jobs():
     """List all scheduled jobs"""
-    with app.app_context():
-        scheduler = get_scheduler_service()
-        if not scheduler:
-            print("Scheduler service not available")
-            return
-        
+    with app.app_context(), scheduler_service() as scheduler:
         jobs = scheduler.get_scheduled_jobs()
         if not jobs:
             print("No scheduled jobs found")
@@ -33,34 +52,21 @@ def schedule_test_reminder():
     """Schedule a test reminder (for testing purposes)"""
     with app.app_context():
         # Get a sample appointment
-        User, Appointment, BlockedDay, Client, SmsLog = create_models(db)
-        
         appointment = Appointment.query.filter_by(status='scheduled').first()
         if not appointment:
             print("No scheduled appointments found")
             return
         
-        scheduler = get_scheduler_service()
-        if not scheduler:
-            print("Scheduler service not available")
-            return
-        
         # Schedule reminder for 1 minute from now (for testing)
         test_time = datetime.now() + timedelta(minutes=1)
-        scheduler.schedule_appointment_reminder(appointment.id, test_time)
+        with scheduler_service() as scheduler:
+            scheduler.schedule_appointment_reminder(appointment.id, test_time)
         print(f"Scheduled test reminder for appointment {appointment.id} at {test_time}")
 
 def remove_all_reminders():
     """Remove all scheduled reminders"""
-    with app.app_context():
-        User, Appointment, BlockedDay, Client, SmsLog = create_models(db)
-        
+    with app.app_context(), scheduler_service() as scheduler:
         appointments = Appointment.query.filter_by(status='scheduled').all()
-        scheduler = get_scheduler_service()
-        
-        if not scheduler:
-            print("Scheduler service not available")
-            return
         
         removed_count = 0
         for appointment in appointments:
@@ -74,18 +80,31 @@ def remove_all_reminders():
 
 def reschedule_all_reminders():
     """Reschedule all pending reminders"""
-    with app.app_context():
-        scheduler = get_scheduler_service()
-        if not scheduler:
-            print("Scheduler service not available")
-            return
-        
+    with app.app_context(), scheduler_service() as scheduler:
         try:
-            scheduler.schedule_all_pending_reminders()
-            print("All pending reminders have been rescheduled")
+            stats = scheduler.schedule_all_pending_reminders()
+            print(f"Reminders reconciled in {stats['elapsed_seconds']}s: "
+                  f"{stats['added']} added, {stats['moved']} moved, "
+                  f"{stats['unchanged']} unchanged, {stats['removed']} removed")
         except Exception as e:
             print(f"Failed to reschedule reminders: {e}")
 
+def rebuild_rollups(user_id=None):
+    """Recompute the monthly appointment rollups from the appointment table"""
+    from models import AppointmentRollup
+    with app.app_context():
+        try:
+            rows = AppointmentRollup.rebuild(user_id)
+            scope = f"user {user_id}" if user_id is not None else "all users"
+            print(f"Rebuilt appointment rollups for {scope}: {rows} rows")
+        except Exception as e:
+            print(f"Failed to rebuild appointment rollups: {e}")
+
+def run_worker():
+    """Run the reminder engine in the foreground"""
+    from services.scheduler_service import run_worker as run_scheduler_worker
+    run_scheduler_worker()
+
 def main():
     """Main function"""
     if len(sys.argv) < 2:
@@ -94,7 +113,9 @@ def main():
         print("  list - List all scheduled jobs")
         print("  test - Schedule a test reminder")
         print("  remove - Remove all scheduled reminders")
-        print("  reschedule - Reschedule all pending reminders")
+        print("  reschedule - Reconcile reminder jobs with pending appointments")
+        print("  run - Run the reminder engine as a dedicated worker process")
+        print("  rebuild-rollups [user_id] - Recompute monthly appointment rollups")
         return
     
     command = sys.argv[1]
@@ -107,6 +128,10 @@ def main():
         remove_all_reminders()
     elif command == 'reschedule':
         reschedule_all_reminders()
+    elif command == 'run':
+        run_worker()
+    elif command == 'rebuild-rollups':
+        rebuild_rollups(int(sys.argv[2]) if len(sys.argv) > 2 else None)
     else:
         print(f"Unknown command: {command}")
 
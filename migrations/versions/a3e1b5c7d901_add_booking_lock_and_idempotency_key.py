@@ -0,0 +1,37 @@
+"""Add booking_lock table and appointment idempotency_key
+
+Revision ID: a3e1b5c7d901
+Revises: f2d0a4b6c890
+Create Date: 2025-10-26 11:07:42.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e1b5c7d901'
+down_revision = 'f2d0a4b6c890'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('booking_lock',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('counter', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_appointment_user_idempotency', ['user_id', 'idempotency_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_user_idempotency')
+        batch_op.drop_column('idempotency_key')
+
+    op.drop_table('booking_lock')
@@ -0,0 +1,31 @@
+"""Add next_attempt_at to sms_outbox for retries and dead-lettering
+
+Revision ID: a7e5b9c1d345
+Revises: f6d4a8b0c234
+Create Date: 2025-10-23 09:14:52.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e5b9c1d345'
+down_revision = 'f6d4a8b0c234'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+    # Failed rows are now dead letters that can be replayed
+    op.execute("UPDATE sms_outbox SET status = 'dead' WHERE status = 'failed'")
+
+
+def downgrade():
+    op.execute("UPDATE sms_outbox SET status = 'failed' WHERE status = 'dead'")
+
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.drop_column('next_attempt_at')
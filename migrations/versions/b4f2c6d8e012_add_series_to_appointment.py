@@ -0,0 +1,30 @@
+"""Add series_id and recurrence_rule to appointment table
+
+Revision ID: b4f2c6d8e012
+Revises: a3e1b5c7d901
+Create Date: 2025-10-26 15:42:09.731264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f2c6d8e012'
+down_revision = 'a3e1b5c7d901'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('series_id', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_rule', sa.String(length=200), nullable=True))
+        batch_op.create_index('ix_appointment_series_id', ['series_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_series_id')
+        batch_op.drop_column('recurrence_rule')
+        batch_op.drop_column('series_id')
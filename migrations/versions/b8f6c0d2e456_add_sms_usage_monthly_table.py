@@ -0,0 +1,60 @@
+"""Add sms_usage_monthly counters and sms_outbox.quota_month
+
+Revision ID: b8f6c0d2e456
+Revises: a7e5b9c1d345
+Create Date: 2025-10-23 15:42:08.630517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f6c0d2e456'
+down_revision = 'a7e5b9c1d345'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    usage_table = op.create_table('sms_usage_monthly',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.Column('reserved', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'month')
+    )
+
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('quota_month', sa.String(length=7), nullable=True))
+
+    # Backfill from the existing log; months are grouped in Python so the
+    # migration does not depend on a database-specific date function
+    sms_log = sa.table('sms_log',
+        sa.column('user_id', sa.Integer),
+        sa.column('timestamp', sa.DateTime),
+        sa.column('cost', sa.Float)
+    )
+    totals = {}
+    for user_id, timestamp, cost in op.get_bind().execute(
+            sa.select(sms_log.c.user_id, sms_log.c.timestamp, sms_log.c.cost)):
+        if user_id is None or timestamp is None:
+            continue
+        key = (user_id, timestamp.strftime('%Y-%m'))
+        count, total_cost = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total_cost + (cost or 0.0))
+
+    if totals:
+        op.bulk_insert(usage_table, [
+            {'user_id': user_id, 'month': month, 'count': count, 'cost': cost, 'reserved': 0}
+            for (user_id, month), (count, cost) in totals.items()
+        ])
+
+
+def downgrade():
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.drop_column('quota_month')
+
+    op.drop_table('sms_usage_monthly')
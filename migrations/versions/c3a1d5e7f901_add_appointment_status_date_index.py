@@ -0,0 +1,26 @@
+"""Add (status, appointment_date) index for the reminder sweeper
+
+Revision ID: c3a1d5e7f901
+Revises: set_admin_superadmin
+Create Date: 2025-10-20 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a1d5e7f901'
+down_revision = 'set_admin_superadmin'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.create_index('ix_appointment_status_date', ['status', 'appointment_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_status_date')
@@ -0,0 +1,66 @@
+"""Add appointment_rollup table
+
+Revision ID: c5a3d7e9f123
+Revises: b4f2c6d8e012
+Create Date: 2025-10-27 09:18:55.204617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a3d7e9f123'
+down_revision = 'b4f2c6d8e012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('appointment_rollup',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total_minutes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'month', 'status')
+    )
+
+    # Existing appointments, grouped the same way AppointmentRollup.rebuild() does
+    appointment = sa.table(
+        'appointment',
+        sa.column('user_id', sa.Integer),
+        sa.column('appointment_date', sa.Date),
+        sa.column('status', sa.String),
+        sa.column('duration', sa.Integer)
+    )
+    rollup = sa.table(
+        'appointment_rollup',
+        sa.column('user_id', sa.Integer),
+        sa.column('month', sa.String),
+        sa.column('status', sa.String),
+        sa.column('count', sa.Integer),
+        sa.column('total_minutes', sa.Integer)
+    )
+    year = sa.extract('year', appointment.c.appointment_date)
+    month = sa.extract('month', appointment.c.appointment_date)
+    connection = op.get_bind()
+    rows = {}
+    for user_id, row_year, row_month, status, count, minutes in connection.execute(
+        sa.select(
+            appointment.c.user_id, year, month, appointment.c.status,
+            sa.func.count(), sa.func.sum(sa.func.coalesce(appointment.c.duration, 60))
+        ).group_by(appointment.c.user_id, year, month, appointment.c.status)
+    ):
+        key = (user_id, f'{int(row_year):04d}-{int(row_month):02d}', status or 'pending')
+        row = rows.setdefault(key, {'user_id': key[0], 'month': key[1], 'status': key[2],
+                                    'count': 0, 'total_minutes': 0})
+        row['count'] += count
+        row['total_minutes'] += int(minutes or 0)
+    if rows:
+        op.bulk_insert(rollup, list(rows.values()))
+
+
+def downgrade():
+    op.drop_table('appointment_rollup')
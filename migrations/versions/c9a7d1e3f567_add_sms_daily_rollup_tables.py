@@ -0,0 +1,47 @@
+"""Add sms_daily_rollup and rollup_watermark tables
+
+Revision ID: c9a7d1e3f567
+Revises: b8f6c0d2e456
+Create Date: 2025-10-24 10:03:26.947152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a7d1e3f567'
+down_revision = 'b8f6c0d2e456'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing sms_log rows are folded in by the rollup job, starting
+    # from an empty watermark
+    op.create_table('rollup_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('sms_daily_rollup',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.Column('successful', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    with op.batch_alter_table('sms_daily_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_sms_daily_rollup_day', ['day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sms_daily_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_sms_daily_rollup_day')
+
+    op.drop_table('sms_daily_rollup')
+    op.drop_table('rollup_watermark')
@@ -0,0 +1,26 @@
+"""Add (user_id, timestamp) index to sms_log
+
+Revision ID: d0b8e2f4a678
+Revises: c9a7d1e3f567
+Create Date: 2025-10-24 14:21:40.512963
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0b8e2f4a678'
+down_revision = 'c9a7d1e3f567'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sms_log', schema=None) as batch_op:
+        batch_op.create_index('ix_sms_log_user_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sms_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_sms_log_user_timestamp')
@@ -0,0 +1,54 @@
+"""Add reminder_due_at and reminder_sent_at to appointment table
+
+Revision ID: d4b2e6f8a012
+Revises: c3a1d5e7f901
+Create Date: 2025-10-20 15:41:09.702316
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b2e6f8a012'
+down_revision = 'c3a1d5e7f901'
+branch_labels = None
+depends_on = None
+
+REMINDER_LEAD_TIME = timedelta(hours=24)
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reminder_due_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('reminder_sent_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_appointment_reminder_due', ['reminder_due_at', 'reminder_sent_at'], unique=False)
+
+    # Backfill the reminder schedule of scheduled appointments
+    appointment = sa.table(
+        'appointment',
+        sa.column('id', sa.Integer),
+        sa.column('appointment_date', sa.Date),
+        sa.column('appointment_time', sa.Time),
+        sa.column('status', sa.String),
+        sa.column('reminder_due_at', sa.DateTime),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(appointment.c.id, appointment.c.appointment_date, appointment.c.appointment_time)
+        .where(appointment.c.status == 'scheduled')
+    ).fetchall()
+    for row in rows:
+        due_at = datetime.combine(row.appointment_date, row.appointment_time) - REMINDER_LEAD_TIME
+        bind.execute(
+            appointment.update().where(appointment.c.id == row.id).values(reminder_due_at=due_at)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_reminder_due')
+        batch_op.drop_column('reminder_sent_at')
+        batch_op.drop_column('reminder_due_at')
@@ -0,0 +1,28 @@
+"""Add covering index for the calendar range API
+
+Revision ID: d6b4e8f0a234
+Revises: c5a3d7e9f123
+Create Date: 2025-10-27 14:02:37.551908
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6b4e8f0a234'
+down_revision = 'c5a3d7e9f123'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.create_index('ix_appointment_user_calendar',
+                              ['user_id', 'appointment_date', 'appointment_time', 'duration', 'status', 'title'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_user_calendar')
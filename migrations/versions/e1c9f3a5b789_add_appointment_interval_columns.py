@@ -0,0 +1,52 @@
+"""Add start_minute and end_minute to appointment table
+
+Revision ID: e1c9f3a5b789
+Revises: d0b8e2f4a678
+Create Date: 2025-10-25 11:36:14.284061
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1c9f3a5b789'
+down_revision = 'd0b8e2f4a678'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start_minute', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('end_minute', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_appointment_user_day_interval',
+                              ['user_id', 'appointment_date', 'start_minute', 'end_minute'], unique=False)
+
+    # Backfill the interval of every appointment
+    appointment = sa.table(
+        'appointment',
+        sa.column('id', sa.Integer),
+        sa.column('appointment_time', sa.Time),
+        sa.column('duration', sa.Integer),
+        sa.column('start_minute', sa.Integer),
+        sa.column('end_minute', sa.Integer),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(appointment.c.id, appointment.c.appointment_time, appointment.c.duration)
+    ).fetchall()
+    for row in rows:
+        start_minute = row.appointment_time.hour * 60 + row.appointment_time.minute
+        end_minute = start_minute + (row.duration if row.duration is not None else 60)
+        bind.execute(
+            appointment.update().where(appointment.c.id == row.id)
+            .values(start_minute=start_minute, end_minute=end_minute)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_user_day_interval')
+        batch_op.drop_column('end_minute')
+        batch_op.drop_column('start_minute')
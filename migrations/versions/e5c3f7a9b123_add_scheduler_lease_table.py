@@ -0,0 +1,30 @@
+"""Add scheduler_lease table for scheduler leader election
+
+Revision ID: e5c3f7a9b123
+Revises: d4b2e6f8a012
+Create Date: 2025-10-21 09:27:53.114820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c3f7a9b123'
+down_revision = 'd4b2e6f8a012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduler_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=120), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_lease')
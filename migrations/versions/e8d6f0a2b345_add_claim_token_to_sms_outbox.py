@@ -0,0 +1,28 @@
+"""Add claim_token to sms_outbox
+
+Revision ID: e8d6f0a2b345
+Revises: d6b4e8f0a234
+Create Date: 2025-10-28 10:41:06.372915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8d6f0a2b345'
+down_revision = 'd6b4e8f0a234'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claim_token', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_sms_outbox_claim_token'), ['claim_token'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sms_outbox_claim_token'))
+        batch_op.drop_column('claim_token')
@@ -0,0 +1,51 @@
+"""Add booking settings and schedule_version to user table
+
+Revision ID: f2d0a4b6c890
+Revises: e1c9f3a5b789
+Create Date: 2025-10-25 16:58:31.406729
+
+"""
+from datetime import time
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2d0a4b6c890'
+down_revision = 'e1c9f3a5b789'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('work_start', sa.Time(), nullable=True))
+        batch_op.add_column(sa.Column('work_end', sa.Time(), nullable=True))
+        batch_op.add_column(sa.Column('work_days', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('slot_length', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('schedule_version', sa.Integer(), nullable=False, server_default='0'))
+
+    # Existing users get the defaults new users get
+    user = sa.table(
+        'user',
+        sa.column('work_start', sa.Time),
+        sa.column('work_end', sa.Time),
+        sa.column('work_days', sa.String),
+        sa.column('slot_length', sa.Integer),
+    )
+    op.get_bind().execute(user.update().values(
+        work_start=time(9, 0),
+        work_end=time(18, 0),
+        work_days='0,1,2,3,4',
+        slot_length=60
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('schedule_version')
+        batch_op.drop_column('slot_length')
+        batch_op.drop_column('work_days')
+        batch_op.drop_column('work_end')
+        batch_op.drop_column('work_start')
@@ -1,10 +1,23 @@
+import logging
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime, date, time
+from datetime import datetime, date, time, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy()
 
+# Reminder SMS is sent this long before the appointment starts
+REMINDER_LEAD_TIME = timedelta(hours=24)
+
+# Appointments in these states do not occupy their time slot
+NON_BLOCKING_STATUSES = ('cancelled', 'rejected')
+
+def to_minutes(value):
+    """Minutes since midnight of a time value"""
+    return value.hour * 60 + value.minute
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
@@ -26,6 +39,13 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     kvkk_accepted_at = db.Column(db.DateTime, nullable=True)  # KVKK onay tarihi
     session_token = db.Column(db.String(64), nullable=True)  # Tek oturum için
+    # Online randevu: çalışma saatleri, günleri (0=Pazartesi) ve slot süresi
+    work_start = db.Column(db.Time, default=time(9, 0))
+    work_end = db.Column(db.Time, default=time(18, 0))
+    work_days = db.Column(db.String(20), default='0,1,2,3,4')
+    slot_length = db.Column(db.Integer, default=60)
+    # Bumped on every appointment/blocked day change; used for ETags
+    schedule_version = db.Column(db.Integer, nullable=False, default=0)
 
     appointments = db.relationship('Appointment', backref='user', lazy=True, cascade='all, delete-orphan')
     blocked_days = db.relationship('BlockedDay', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -50,13 +70,28 @@ class User(UserMixin, db.Model):
     def get_appointments_count(self):
         return Appointment.query.filter_by(user_id=self.id).count()
 
+    def get_pending_count(self):
+        from services.stats_cache import stats_cache
+        return stats_cache.get_or_compute(
+            self.id, 'pending_count',
+            lambda: Appointment.query.filter_by(user_id=self.id, status='pending').count()
+        )
+
     def get_remaining_sms_quota(self):
-        current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        used_sms = SmsLog.query.filter(
-            SmsLog.user_id == self.id,
-            SmsLog.timestamp >= current_month
-        ).count()
-        return max(0, self.sms_quota - used_sms)
+        return max(0, self.sms_quota - SmsUsageMonthly.get_used(self.id))
+
+    def get_working_minutes(self):
+        start = to_minutes(self.work_start) if self.work_start else 9 * 60
+        end = to_minutes(self.work_end) if self.work_end else 18 * 60
+        return start, end
+
+    def get_work_days(self):
+        if self.work_days is None:
+            return {0, 1, 2, 3, 4}
+        return {int(day) for day in self.work_days.split(',') if day.strip().isdigit()}
+
+    def get_slot_length(self):
+        return self.slot_length or 60
 
     def get_company_display_name(self):
         return self.company_name if self.company_name else self.get_full_name()
@@ -69,6 +104,19 @@ class User(UserMixin, db.Model):
 
 class Appointment(db.Model):
     __tablename__ = 'appointment'
+    __table_args__ = (
+        db.Index('ix_appointment_status_date', 'status', 'appointment_date'),
+        # Reminder sweeper: unsent reminders due in a time range
+        db.Index('ix_appointment_reminder_due', 'reminder_due_at', 'reminder_sent_at'),
+        # Conflict checks: overlapping intervals within one user's day
+        db.Index('ix_appointment_user_day_interval', 'user_id', 'appointment_date', 'start_minute', 'end_minute'),
+        # A retried booking form submission finds the row it already created
+        db.Index('ix_appointment_user_idempotency', 'user_id', 'idempotency_key', unique=True),
+        db.Index('ix_appointment_series_id', 'series_id'),
+        # Calendar range API: every column it loads is in the index
+        db.Index('ix_appointment_user_calendar', 'user_id', 'appointment_date', 'appointment_time',
+                 'duration', 'status', 'title'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
@@ -80,12 +128,38 @@ class Appointment(db.Model):
     status = db.Column(db.String(20), default='pending')
     location = db.Column(db.String(200))
     notes = db.Column(db.Text)
+    # Denormalized reminder schedule, kept in sync by the mapper events below
+    reminder_due_at = db.Column(db.DateTime, nullable=True)
+    reminder_sent_at = db.Column(db.DateTime, nullable=True)
+    # [start_minute, end_minute) within appointment_date, kept in sync with
+    # appointment_time/duration by the mapper events below
+    start_minute = db.Column(db.Integer)
+    end_minute = db.Column(db.Integer)
+    idempotency_key = db.Column(db.String(64))  # Set by the public booking form
+    # Occurrences of a recurring appointment share series_id and the RRULE
+    # they were expanded from (see services/recurrence.py)
+    series_id = db.Column(db.String(32))
+    recurrence_rule = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def get_datetime(self):
         return datetime.combine(self.appointment_date, self.appointment_time)
 
+    def get_reminder_time(self):
+        return self.get_datetime() - REMINDER_LEAD_TIME
+
+    def refresh_reminder_schedule(self):
+        """Recompute reminder_due_at; a moved appointment gets a new reminder"""
+        due_at = self.get_reminder_time() if self.status == 'scheduled' else None
+        if due_at is not None and due_at != self.reminder_due_at:
+            self.reminder_sent_at = None
+        self.reminder_due_at = due_at
+
+    def refresh_interval(self):
+        self.start_minute = to_minutes(self.appointment_time)
+        self.end_minute = self.start_minute + (self.duration if self.duration is not None else 60)
+
     def is_past(self):
         return self.get_datetime() < datetime.now()
 
@@ -111,6 +185,44 @@ class Appointment(db.Model):
         }
         return status_texts.get(self.status, 'Bilinmiyor')
 
+    @staticmethod
+    def find_conflict(user_id, appointment_date, start_minute, end_minute, exclude_id=None):
+        """
+        First appointment of the user overlapping [start_minute, end_minute)
+        
+        Two intervals overlap when each starts before the other ends; with
+        the (user_id, appointment_date, start_minute, end_minute) index this
+        is a single index range scan.
+        """
+        query = Appointment.query.filter(
+            Appointment.user_id == user_id,
+            Appointment.appointment_date == appointment_date,
+            Appointment.start_minute < end_minute,
+            Appointment.end_minute > start_minute,
+            Appointment.status.notin_(NON_BLOCKING_STATUSES)
+        )
+        if exclude_id:
+            query = query.filter(Appointment.id != exclude_id)
+        return query.order_by(Appointment.start_minute.asc()).first()
+
+    @staticmethod
+    def find_conflicts(user_id, dates, start_minute, end_minute):
+        """
+        Appointments of the user overlapping [start_minute, end_minute) on any of the dates
+        
+        One range scan over the interval index covers the whole span of
+        dates; days in between that are not in ``dates`` are filtered out.
+        """
+        return Appointment.query.filter(
+            Appointment.user_id == user_id,
+            Appointment.appointment_date >= min(dates),
+            Appointment.appointment_date <= max(dates),
+            Appointment.appointment_date.in_(dates),
+            Appointment.start_minute < end_minute,
+            Appointment.end_minute > start_minute,
+            Appointment.status.notin_(NON_BLOCKING_STATUSES)
+        ).order_by(Appointment.appointment_date.asc(), Appointment.start_minute.asc()).all()
+
     @staticmethod
     def get_today_appointments(user_id=None):
         query = Appointment.query.filter(Appointment.appointment_date == date.today())
@@ -131,6 +243,44 @@ class Appointment(db.Model):
     def __repr__(self):
         return f'<Appointment {self.title} - {self.appointment_date}>'
 
+@db.event.listens_for(Appointment, 'before_insert')
+def _appointment_before_insert(mapper, connection, target):
+    target.refresh_reminder_schedule()
+    target.refresh_interval()
+
+@db.event.listens_for(Appointment, 'before_update')
+def _appointment_before_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes()
+           for name in ('appointment_date', 'appointment_time', 'status')):
+        target.refresh_reminder_schedule()
+    if any(state.attrs[name].history.has_changes()
+           for name in ('appointment_time', 'duration')):
+        target.refresh_interval()
+
+# Schedule-relevant appointment fields; other updates (e.g. reminder
+# stamps) do not change availability
+SCHEDULE_FIELDS = ('user_id', 'appointment_date', 'appointment_time', 'duration', 'status')
+
+def _bump_schedule_version(connection, user_id):
+    table = User.__table__
+    # Setting updated_at to itself skips its onupdate: a schedule change
+    # is not a profile change
+    connection.execute(table.update().where(table.c.id == user_id)
+                       .values(schedule_version=table.c.schedule_version + 1,
+                               updated_at=table.c.updated_at))
+
+@db.event.listens_for(Appointment, 'after_insert')
+@db.event.listens_for(Appointment, 'after_delete')
+def _appointment_schedule_changed(mapper, connection, target):
+    _bump_schedule_version(connection, target.user_id)
+
+@db.event.listens_for(Appointment, 'after_update')
+def _appointment_after_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in SCHEDULE_FIELDS):
+        _bump_schedule_version(connection, target.user_id)
+
 class BlockedDay(db.Model):
     __tablename__ = 'blocked_day'
     id = db.Column(db.Integer, primary_key=True)
@@ -168,6 +318,12 @@ class BlockedDay(db.Model):
     def __repr__(self):
         return f'<BlockedDay {self.date} - {self.reason or "No reason"}>'
 
+@db.event.listens_for(BlockedDay, 'after_insert')
+@db.event.listens_for(BlockedDay, 'after_update')
+@db.event.listens_for(BlockedDay, 'after_delete')
+def _blocked_day_changed(mapper, connection, target):
+    _bump_schedule_version(connection, target.user_id)
+
 class Client(db.Model):
     __tablename__ = 'client'
     id = db.Column(db.Integer, primary_key=True)
@@ -216,6 +372,9 @@ class Client(db.Model):
 
 class SmsLog(db.Model):
     __tablename__ = 'sms_log'
+    __table_args__ = (
+        db.Index('ix_sms_log_user_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
@@ -252,22 +411,43 @@ class SmsLog(db.Model):
 
     @staticmethod
     def get_user_sms_stats(user_id, start_date=None, end_date=None):
-        query = SmsLog.query.filter(SmsLog.user_id == user_id)
+        return SmsLog.get_users_sms_stats([user_id], start_date, end_date)[user_id]
+
+    @staticmethod
+    def get_users_sms_stats(user_ids, start_date=None, end_date=None):
+        """SMS stats of several users from one grouped scan, keyed by user id"""
+        def stats(total_sms=0, successful_sms=0, failed_sms=0, pending_sms=0):
+            return {
+                'total': total_sms,
+                'successful': successful_sms,
+                'failed': failed_sms,
+                'pending': pending_sms,
+                'success_rate': (successful_sms / total_sms * 100) if total_sms > 0 else 0
+            }
+
+        user_ids = list(user_ids)
+        result = {user_id: stats() for user_id in user_ids}
+        if not user_ids:
+            return result
+
+        def count_where(condition):
+            return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+        query = db.session.query(
+            SmsLog.user_id,
+            db.func.count(SmsLog.id),
+            count_where(SmsLog.status.in_(['sent', 'delivered'])),
+            count_where(SmsLog.status == 'failed'),
+            count_where(SmsLog.status == 'pending')
+        ).filter(SmsLog.user_id.in_(user_ids))
         if start_date:
             query = query.filter(SmsLog.timestamp >= start_date)
         if end_date:
             query = query.filter(SmsLog.timestamp <= end_date)
-        total_sms = query.count()
-        successful_sms = query.filter(SmsLog.status.in_(['sent', 'delivered'])).count()
-        failed_sms = query.filter(SmsLog.status == 'failed').count()
-        pending_sms = query.filter(SmsLog.status == 'pending').count()
-        return {
-            'total': total_sms,
-            'successful': successful_sms,
-            'failed': failed_sms,
-            'pending': pending_sms,
-            'success_rate': (successful_sms / total_sms * 100) if total_sms > 0 else 0
-        }
+
+        for user_id, total_sms, successful_sms, failed_sms, pending_sms in query.group_by(SmsLog.user_id):
+            result[user_id] = stats(total_sms, successful_sms, failed_sms, pending_sms)
+        return result
 
     @staticmethod
     def get_recent_sms(user_id, limit=10):
@@ -276,4 +456,498 @@ class SmsLog(db.Model):
         ).order_by(SmsLog.timestamp.desc()).limit(limit).all()
 
     def __repr__(self):
-        return f'<SmsLog {self.id} - {self.status} - {self.timestamp}>'
\ No newline at end of file
+        return f'<SmsLog {self.id} - {self.status} - {self.timestamp}>'
+
+def _insert_missing_row(connection, table, values):
+    """Insert a counter row unless a row with its primary key exists"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(table).values(**values).on_conflict_do_nothing())
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        connection.execute(insert(table).values(**values).on_conflict_do_nothing())
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        key = table.primary_key.columns.values()[0]
+        connection.execute(insert(table).values(**values).on_duplicate_key_update({key.name: key}))
+    elif connection.execute(db.select(*table.primary_key.columns).where(
+            *[column == values[column.name] for column in table.primary_key.columns])).first() is None:
+        connection.execute(table.insert().values(**values))
+
+def _increment_counters(connection, table, key, deltas):
+    """Add ``deltas`` to the counter row identified by ``key``, creating it if needed"""
+    _insert_missing_row(connection, table, {**key, **{name: 0 for name in deltas}})
+    connection.execute(table.update().where(
+        *[table.c[name] == value for name, value in key.items()]
+    ).values({name: table.c[name] + delta for name, delta in deltas.items()}))
+
+class SmsUsageMonthly(db.Model):
+    """
+    Per-user SMS counters for one calendar month (UTC)
+    
+    ``count`` and ``cost`` follow sms_log (every logged SMS counts against
+    the quota); ``reserved`` holds SMS that passed the quota check and are
+    still waiting to be sent. All changes are single-row UPDATEs, so a
+    quota check or reservation is O(1) however large sms_log gets.
+    """
+    __tablename__ = 'sms_usage_monthly'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    count = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+    reserved = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def month_key(moment=None):
+        return (moment or datetime.utcnow()).strftime('%Y-%m')
+
+    @staticmethod
+    def get_used(user_id, month=None):
+        usage = db.session.get(SmsUsageMonthly, (user_id, month or SmsUsageMonthly.month_key()))
+        return usage.count + usage.reserved if usage else 0
+
+    @staticmethod
+    def add(connection, user_id, month, count=0, cost=0.0, reserved=0):
+        """Apply counter deltas in one atomic UPDATE"""
+        _increment_counters(
+            connection, SmsUsageMonthly.__table__,
+            {'user_id': user_id, 'month': month},
+            {'count': count, 'cost': cost, 'reserved': reserved}
+        )
+
+    @staticmethod
+    def reserve(connection, user_id, quota, count=1, month=None):
+        """
+        Reserve quota for SMS about to be sent
+        
+        Returns:
+            The reserved month key, or None if the quota is used up
+        """
+        table = SmsUsageMonthly.__table__
+        month = month or SmsUsageMonthly.month_key()
+        _insert_missing_row(connection, table, {
+            'user_id': user_id, 'month': month, 'count': 0, 'cost': 0.0, 'reserved': 0
+        })
+        result = connection.execute(table.update().where(
+            table.c.user_id == user_id,
+            table.c.month == month,
+            table.c.count + table.c.reserved + count <= quota
+        ).values(reserved=table.c.reserved + count))
+        return month if result.rowcount == 1 else None
+
+    @staticmethod
+    def release(connection, user_id, month, count=1):
+        """Drop a reservation; the SMS is counted by its sms_log row instead"""
+        SmsUsageMonthly.add(connection, user_id, month, reserved=-count)
+
+    def __repr__(self):
+        return f'<SmsUsageMonthly {self.user_id} {self.month} - {self.count}>'
+
+@db.event.listens_for(SmsLog, 'after_insert')
+def _sms_log_after_insert(mapper, connection, target):
+    # Same transaction as the sms_log row, so the counters never drift
+    SmsUsageMonthly.add(
+        connection,
+        target.user_id,
+        SmsUsageMonthly.month_key(target.timestamp),
+        count=1,
+        cost=target.cost or 0.0
+    )
+
+class RollupWatermark(db.Model):
+    """Id of the last source row folded into a rollup table"""
+    __tablename__ = 'rollup_watermark'
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def get_last_id(name):
+        # Column query rather than session.get(), which would answer from
+        # the identity map without seeing other processes' commits
+        last_id = db.session.query(RollupWatermark.last_id).filter(RollupWatermark.name == name).scalar()
+        return last_id or 0
+
+    @staticmethod
+    def advance(connection, name, from_id, to_id):
+        """
+        Move the watermark from ``from_id`` to ``to_id``
+        
+        Returns:
+            False if another process moved it first
+        """
+        table = RollupWatermark.__table__
+        _insert_missing_row(connection, table, {'name': name, 'last_id': 0})
+        result = connection.execute(table.update().where(
+            table.c.name == name,
+            table.c.last_id == from_id
+        ).values(last_id=to_id, updated_at=datetime.utcnow()))
+        return result.rowcount == 1
+
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} - {self.last_id}>'
+
+class SmsDailyRollup(db.Model):
+    """
+    Per-user, per-day SMS totals folded from sms_log
+    
+    sms_log rows are never updated once written, so a watermark on their id
+    is enough to roll them up incrementally. Reports read the rollups and
+    only the raw rows past the watermark.
+    """
+    __tablename__ = 'sms_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_sms_daily_rollup_day', 'day'),
+    )
+    WATERMARK = 'sms_daily_rollup'
+    # Rows younger than this are left for the next run, so ids still being
+    # committed by concurrent writers are not skipped
+    SETTLE_TIME = timedelta(seconds=60)
+    # Reads of a usage report before giving up on a consistent result
+    REPORT_ATTEMPTS = 3
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+    successful = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def _day_column():
+        return db.func.date(SmsLog.timestamp, type_=db.Date)
+
+    @staticmethod
+    def roll_up(batch_size=10000):
+        """
+        Fold the next batch of sms_log rows past the watermark
+        
+        Returns:
+            Number of sms_log rows folded (0 when caught up)
+        """
+        watermark = RollupWatermark.get_last_id(SmsDailyRollup.WATERMARK)
+        settled_before = datetime.utcnow() - SmsDailyRollup.SETTLE_TIME
+
+        # Stop in front of the first unsettled row so no id is skipped
+        fence = db.session.query(db.func.min(SmsLog.id)).filter(
+            SmsLog.id > watermark,
+            SmsLog.timestamp >= settled_before
+        ).scalar()
+        batch_ids = db.session.query(SmsLog.id).filter(SmsLog.id > watermark)
+        if fence is not None:
+            batch_ids = batch_ids.filter(SmsLog.id < fence)
+        batch_ids = batch_ids.order_by(SmsLog.id.asc()).limit(batch_size).subquery()
+        upto = db.session.query(db.func.max(batch_ids.c.id)).scalar()
+        if upto is None:
+            return 0
+
+        day = SmsDailyRollup._day_column()
+        groups = db.session.query(
+            SmsLog.user_id,
+            day.label('day'),
+            db.func.count(SmsLog.id),
+            db.func.coalesce(db.func.sum(SmsLog.cost), 0.0),
+            db.func.sum(db.case((SmsLog.status.in_(['sent', 'delivered']), 1), else_=0)),
+            db.func.sum(db.case((SmsLog.status == 'failed', 1), else_=0))
+        ).filter(
+            SmsLog.id > watermark,
+            SmsLog.id <= upto
+        ).group_by(SmsLog.user_id, day).all()
+
+        connection = db.session.connection()
+        if not RollupWatermark.advance(connection, SmsDailyRollup.WATERMARK, watermark, upto):
+            db.session.rollback()
+            return 0
+
+        folded = 0
+        for user_id, log_day, count, cost, successful, failed in groups:
+            _increment_counters(
+                connection, SmsDailyRollup.__table__,
+                {'user_id': user_id, 'day': log_day},
+                {'count': count, 'cost': cost, 'successful': successful, 'failed': failed}
+            )
+            folded += count
+        db.session.commit()
+        return folded
+
+    @staticmethod
+    def _read_usage(start_date, end_date, watermark):
+        """Per-user [count, cost] and per-day counts from the rollups plus the raw tail"""
+        per_user = {}
+        per_day = {}
+
+        def add(user_id, log_day, count, cost):
+            totals = per_user.setdefault(user_id, [0, 0.0])
+            totals[0] += count
+            totals[1] += cost or 0.0
+            per_day[log_day] = per_day.get(log_day, 0) + count
+
+        for row in db.session.query(
+            SmsDailyRollup.user_id, SmsDailyRollup.day, SmsDailyRollup.count, SmsDailyRollup.cost
+        ).filter(
+            SmsDailyRollup.day >= start_date,
+            SmsDailyRollup.day <= end_date
+        ):
+            add(*row)
+
+        # Tail that has not been rolled up yet
+        day = SmsDailyRollup._day_column()
+        for row in db.session.query(
+            SmsLog.user_id, day, db.func.count(SmsLog.id), db.func.sum(SmsLog.cost)
+        ).filter(
+            SmsLog.id > watermark,
+            SmsLog.timestamp >= start_date,
+            SmsLog.timestamp < end_date + timedelta(days=1)
+        ).group_by(SmsLog.user_id, day):
+            add(*row)
+        return per_user, per_day
+
+    @staticmethod
+    def get_usage_report(start_date, end_date):
+        """
+        SMS usage per user and per day between two dates (inclusive)
+        
+        Returns:
+            (usage_by_user, daily) where usage_by_user has id, username,
+            email, sms_quota, sms_count and total_cost per user (most SMS
+            first) and daily has date and count per day
+        """
+        # The rollups and the raw tail past the watermark must come from
+        # the same state: a roll_up committing between the two reads would
+        # count its rows in both. roll_up moves the watermark in the commit
+        # that adds to the rollups and never moves it back, so an unchanged
+        # watermark after both reads proves no roll_up committed in between.
+        watermark = RollupWatermark.get_last_id(SmsDailyRollup.WATERMARK)
+        for _ in range(SmsDailyRollup.REPORT_ATTEMPTS):
+            per_user, per_day = SmsDailyRollup._read_usage(start_date, end_date, watermark)
+            latest = RollupWatermark.get_last_id(SmsDailyRollup.WATERMARK)
+            if latest == watermark:
+                break
+            watermark = latest
+        else:
+            logger.warning("SMS usage report raced with the rollup job, figures may be approximate")
+
+        users = User.query.filter(User.id.in_(per_user.keys())).all() if per_user else []
+        usage_by_user = sorted([{
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'sms_quota': user.sms_quota,
+            'sms_count': per_user[user.id][0],
+            'total_cost': per_user[user.id][1]
+        } for user in users], key=lambda usage: usage['sms_count'], reverse=True)
+        daily = [{'date': log_day, 'count': count} for log_day, count in sorted(per_day.items())]
+        return usage_by_user, daily
+
+    def __repr__(self):
+        return f'<SmsDailyRollup {self.user_id} {self.day} - {self.count}>'
+
+class AppointmentRollup(db.Model):
+    """
+    Per-user appointment count and booked minutes per month and status
+    
+    Kept in step with the appointment table by the mapper events below
+    (same transaction as the appointment write), so trend queries read one
+    row per month instead of scanning the whole history. rebuild()
+    recomputes it from scratch (``python manage_scheduler.py rebuild-rollups``).
+    """
+    __tablename__ = 'appointment_rollup'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM of appointment_date
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def month_key(day):
+        return day.strftime('%Y-%m')
+
+    @staticmethod
+    def add(connection, user_id, day, status, count, minutes):
+        """Apply deltas to the row of the month containing ``day``"""
+        _increment_counters(
+            connection, AppointmentRollup.__table__,
+            {'user_id': user_id, 'month': AppointmentRollup.month_key(day), 'status': status or 'pending'},
+            {'count': count, 'total_minutes': minutes}
+        )
+
+    @staticmethod
+    def rebuild(user_id=None):
+        """
+        Recompute the rollup from the appointment table and commit
+        
+        Runs in one transaction (delete, then insert the grouped counts).
+        Appointment writes committed by other processes while it runs can
+        be missed on databases without table-level write locks, so run it
+        when traffic is low.
+        
+        Args:
+            user_id: Only rebuild this user's rows
+            
+        Returns:
+            Number of rollup rows written
+        """
+        year = db.extract('year', Appointment.appointment_date)
+        month = db.extract('month', Appointment.appointment_date)
+        query = db.session.query(
+            Appointment.user_id, year, month, Appointment.status,
+            db.func.count(Appointment.id),
+            db.func.sum(db.func.coalesce(Appointment.duration, 60))
+        ).group_by(Appointment.user_id, year, month, Appointment.status)
+        if user_id is not None:
+            query = query.filter(Appointment.user_id == user_id)
+
+        rows = {}
+        for owner, row_year, row_month, status, count, minutes in query:
+            key = (owner, f'{int(row_year):04d}-{int(row_month):02d}', status or 'pending')
+            row = rows.setdefault(key, {'user_id': key[0], 'month': key[1], 'status': key[2],
+                                        'count': 0, 'total_minutes': 0})
+            row['count'] += count
+            row['total_minutes'] += int(minutes or 0)
+
+        table = AppointmentRollup.__table__
+        try:
+            delete = table.delete()
+            if user_id is not None:
+                delete = delete.where(table.c.user_id == user_id)
+            db.session.execute(delete)
+            if rows:
+                db.session.execute(table.insert(), list(rows.values()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(rows)
+
+    @staticmethod
+    def get_monthly(user_id=None, start_month=None, end_month=None):
+        """
+        (month, status, count, total_minutes) rows, summed over users when
+        ``user_id`` is None; months are 'YYYY-MM' and inclusive
+        """
+        query = db.session.query(
+            AppointmentRollup.month,
+            AppointmentRollup.status,
+            db.func.sum(AppointmentRollup.count),
+            db.func.sum(AppointmentRollup.total_minutes)
+        )
+        if user_id is not None:
+            query = query.filter(AppointmentRollup.user_id == user_id)
+        if start_month:
+            query = query.filter(AppointmentRollup.month >= start_month)
+        if end_month:
+            query = query.filter(AppointmentRollup.month <= end_month)
+        return [
+            (row_month, status, int(count or 0), int(minutes or 0))
+            for row_month, status, count, minutes in query.group_by(
+                AppointmentRollup.month, AppointmentRollup.status
+            ).order_by(AppointmentRollup.month.asc())
+        ]
+
+    def __repr__(self):
+        return f'<AppointmentRollup {self.user_id} {self.month} {self.status} - {self.count}>'
+
+def _appointment_minutes(duration):
+    return duration if duration is not None else 60
+
+@db.event.listens_for(Appointment, 'after_insert')
+def _appointment_rollup_insert(mapper, connection, target):
+    AppointmentRollup.add(connection, target.user_id, target.appointment_date, target.status,
+                          1, _appointment_minutes(target.duration))
+
+@db.event.listens_for(Appointment, 'after_delete')
+def _appointment_rollup_delete(mapper, connection, target):
+    AppointmentRollup.add(connection, target.user_id, target.appointment_date, target.status,
+                          -1, -_appointment_minutes(target.duration))
+
+@db.event.listens_for(Appointment, 'after_update')
+def _appointment_rollup_update(mapper, connection, target):
+    state = db.inspect(target)
+    fields = ('user_id', 'appointment_date', 'status', 'duration')
+    if not any(state.attrs[name].history.has_changes() for name in fields):
+        return
+    previous = {}
+    for name in fields:
+        history = state.attrs[name].history
+        previous[name] = history.deleted[0] if history.deleted else getattr(target, name)
+    AppointmentRollup.add(connection, previous['user_id'], previous['appointment_date'], previous['status'],
+                          -1, -_appointment_minutes(previous['duration']))
+    AppointmentRollup.add(connection, target.user_id, target.appointment_date, target.status,
+                          1, _appointment_minutes(target.duration))
+
+class SmsOutbox(db.Model):
+    """SMS waiting to be sent; written in the same transaction as the change that triggers it"""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_id', 'status', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id', ondelete='SET NULL'), nullable=True)
+    phone = db.Column(db.String(20))
+    message = db.Column(db.Text, nullable=False)
+    log_message = db.Column(db.Text)  # Text written to sms_log
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)  # Retry backoff; NULL = as soon as possible
+    quota_month = db.Column(db.String(7))  # Month holding this SMS's quota reservation
+    error_message = db.Column(db.Text)
+    sms_provider = db.Column(db.String(50))
+    provider_message_id = db.Column(db.String(100))
+    cost = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), index=True)  # Set by the drain that claimed the row
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+
+    def is_final(self):
+        return self.status in ['sent', 'dead']
+
+    def __repr__(self):
+        return f'<SmsOutbox {self.id} - {self.status}>'
+
+class BookingLock(db.Model):
+    """
+    One row per (user, day) that booking transactions update first
+    
+    The UPDATE serializes concurrent bookings of the same day: Postgres
+    locks the row until commit, SQLite takes its write lock.
+    """
+    __tablename__ = 'booking_lock'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    counter = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def acquire(connection, user_id, day):
+        _increment_counters(connection, BookingLock.__table__,
+                            {'user_id': user_id, 'day': day}, {'counter': 1})
+
+    @staticmethod
+    def acquire_many(connection, user_id, days):
+        """Lock several days of a user with a single UPDATE"""
+        table = BookingLock.__table__
+        for day in days:
+            _insert_missing_row(connection, table, {'user_id': user_id, 'day': day, 'counter': 0})
+        connection.execute(table.update().where(
+            table.c.user_id == user_id, table.c.day.in_(days)
+        ).values(counter=table.c.counter + 1))
+
+    def __repr__(self):
+        return f'<BookingLock {self.user_id} {self.day}>'
+
+class SchedulerLease(db.Model):
+    """Lease row used to elect the single process that runs the scheduler"""
+    __tablename__ = 'scheduler_lease'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def is_expired(self):
+        return self.expires_at < datetime.utcnow()
+
+    def __repr__(self):
+        return f'<SchedulerLease {self.name} - {self.holder} until {self.expires_at}>'
@@ -3,7 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta
 from sqlalchemy import func
-from models import User, Appointment, SmsLog, db
+from models import User, Appointment, AppointmentRollup, SmsLog, SmsOutbox, SmsUsageMonthly, SmsDailyRollup, db
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -28,7 +28,24 @@ def admin_dashboard():
     total_users = User.query.count()
     active_users = User.query.filter_by(is_active=True).count()
     superadmin_users = User.query.filter_by(is_superadmin=True).count()
-    total_appointments = Appointment.query.count()
+
+    # Randevu trendi (son 12 ay) ve toplam, aylık özet tablosundan
+    this_month = date.today().replace(day=1)
+    first_year, first_month_index = divmod(this_month.year * 12 + this_month.month - 1 - 11, 12)
+    first_month = date(first_year, first_month_index + 1, 1)
+    appointment_trend = {}
+    for month, status, count, minutes in AppointmentRollup.get_monthly(
+            start_month=AppointmentRollup.month_key(first_month),
+            end_month=AppointmentRollup.month_key(this_month)):
+        trend = appointment_trend.setdefault(month, {'month': month, 'count': 0, 'hours': 0.0, 'cancelled': 0})
+        trend['count'] += count
+        trend['hours'] += minutes / 60
+        if status in ('cancelled', 'rejected'):
+            trend['cancelled'] += count
+    appointment_trend = [appointment_trend[month] for month in sorted(appointment_trend)]
+    total_appointments = db.session.query(
+        func.coalesce(func.sum(AppointmentRollup.count), 0)
+    ).scalar()
 
     # SMS istatistikleri
     sms_stats = db.session.query(
@@ -50,6 +67,7 @@ def admin_dashboard():
                          active_users=active_users,
                          superadmin_users=superadmin_users,
                          total_appointments=total_appointments,
+                         appointment_trend=appointment_trend,
                          sms_stats=sms_stats,
                          recent_users=recent_users,
                          monthly_users=monthly_users)
@@ -93,8 +111,13 @@ def users_list():
         page=page, per_page=per_page, error_out=False
     )
 
+    # Sayfadaki kullanıcıların bu ayki SMS durumu (tek sorgu)
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    sms_stats = SmsLog.get_users_sms_stats([user.id for user in users.items], start_date=month_start)
+
     return render_template('admin/users.html',
                          users=users,
+                         sms_stats=sms_stats,
                          search=search,
                          role_filter=role_filter,
                          status_filter=status_filter)
@@ -164,26 +187,8 @@ def sms_usage():
     else:
         end_date = date.today()
 
-    # Kullanıcı bazında SMS kullanımı
-    sms_usage_by_user = db.session.query(
-        User.username,
-        User.email,
-        User.sms_quota,
-        func.count(SmsLog.id).label('sms_count'),
-        func.sum(SmsLog.cost).label('total_cost')
-    ).join(SmsLog, User.id == SmsLog.user_id).filter(
-        SmsLog.timestamp >= start_date,
-        SmsLog.timestamp <= end_date
-    ).group_by(User.id).order_by(func.count(SmsLog.id).desc()).all()
-
-    # Günlük SMS gönderimi
-    daily_sms = db.session.query(
-        func.date(SmsLog.timestamp).label('date'),
-        func.count(SmsLog.id).label('count')
-    ).filter(
-        SmsLog.timestamp >= start_date,
-        SmsLog.timestamp <= end_date
-    ).group_by(func.date(SmsLog.timestamp)).order_by(func.date(SmsLog.timestamp)).all()
+    # Kullanıcı ve gün bazında SMS kullanımı (günlük özetler + özetlenmemiş son kayıtlar)
+    sms_usage_by_user, daily_sms = SmsDailyRollup.get_usage_report(start_date, end_date)
 
     return render_template('admin/sms_usage.html',
                          sms_usage_by_user=sms_usage_by_user,
@@ -202,11 +207,11 @@ def quota_management():
         User.username,
         User.email,
         User.sms_quota,
-        func.count(SmsLog.id).label('used_sms')
-    ).outerjoin(SmsLog, db.and_(
-        User.id == SmsLog.user_id,
-        func.strftime('%Y-%m', SmsLog.timestamp) == func.strftime('%Y-%m', 'now')
-    )).group_by(User.id).order_by(User.sms_quota.desc()).all()
+        func.coalesce(SmsUsageMonthly.count + SmsUsageMonthly.reserved, 0).label('used_sms')
+    ).outerjoin(SmsUsageMonthly, db.and_(
+        User.id == SmsUsageMonthly.user_id,
+        SmsUsageMonthly.month == SmsUsageMonthly.month_key()
+    )).order_by(User.sms_quota.desc()).all()
 
     return render_template('admin/quota_management.html',
                          users_with_quotas=users_with_quotas)
@@ -229,3 +234,58 @@ def update_quota(user_id):
     flash(f'{user.username} kullanıcısının SMS kotası {new_quota} olarak güncellendi.', 'success')
 
     return redirect(url_for('admin.quota_management'))
+
+@admin_bp.route('/sms-metrics')
+@login_required
+@admin_required
+def sms_metrics():
+    """SMS gönderim metrikleri (hız sınırı bekleme süreleri)"""
+    from services.sms_service import get_sms_service
+    return jsonify(get_sms_service().get_metrics())
+
+@admin_bp.route('/sms-dead-letters')
+@login_required
+@admin_required
+def sms_dead_letters():
+    """Tüm denemelere rağmen gönderilemeyen SMS'ler"""
+    dead_letters = SmsOutbox.query.filter_by(status='dead')\
+        .order_by(SmsOutbox.id.desc()).limit(200).all()
+    dead_count = SmsOutbox.query.filter_by(status='dead').count()
+
+    return render_template('admin/sms_dead_letters.html',
+                         dead_letters=dead_letters,
+                         dead_count=dead_count)
+
+@admin_bp.route('/sms-dead-letters/replay', methods=['POST'])
+@login_required
+@admin_required
+def replay_sms_dead_letters():
+    """Gönderilemeyen SMS'leri tekrar kuyruğa al"""
+    from services.sms_outbox import replay_dead_letters
+
+    if request.form.get('replay_all'):
+        ids = None
+    else:
+        ids = request.form.getlist('outbox_ids', type=int)
+        if not ids:
+            flash('Tekrar gönderilecek SMS seçin!', 'error')
+            return redirect(url_for('admin.sms_dead_letters'))
+
+    result = replay_dead_letters(db, ids)
+    flash(f"{result['replayed']} SMS tekrar gönderim kuyruğuna alındı.", 'success')
+    if result['over_quota']:
+        flash(f"{result['over_quota']} SMS, kullanıcının aylık SMS kotası dolduğu için kuyruğa alınmadı.", 'warning')
+
+    return redirect(url_for('admin.sms_dead_letters'))
+
+@admin_bp.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    """Önbellek isabet istatistikleri"""
+    from services.schedule_cache import day_schedule_cache
+    from services.stats_cache import stats_cache
+    return jsonify({
+        'day_schedule': day_schedule_cache.get_stats(),
+        'stats': stats_cache.get_stats()
+    })
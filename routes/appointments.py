@@ -1,14 +1,26 @@
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app
 from flask_login import login_required, current_user
+import uuid
 from datetime import datetime, date, time, timedelta
 from werkzeug.exceptions import abort
-from models import Appointment, BlockedDay, db, SmsLog, Client, User
+from models import Appointment, BlockedDay, db, SmsLog, Client, User, to_minutes
 from sqlalchemy import func, and_, or_
 from flask_wtf.csrf import generate_csrf
+from services.availability import format_minutes, is_offered_slot
+from services.schedule_cache import day_schedule_cache
+from services.booking import book_public_appointment, create_appointment_series
+from services.recurrence import MAX_OCCURRENCES, expand_rule
 
 appointments_bp = Blueprint('appointments', __name__)
 
+# Tekrar seçenekleri ve karşılık gelen RRULE
+REPEAT_RULES = {
+    'DAILY': 'FREQ=DAILY',
+    'WEEKLY': 'FREQ=WEEKLY',
+    'BIWEEKLY': 'FREQ=WEEKLY;INTERVAL=2',
+}
+
 # Eğitmen panelinde bekleyen randevular
 @appointments_bp.route('/pending')
 @login_required
@@ -35,6 +47,56 @@ def reject_appointment(appointment_id):
     flash('Randevu reddedildi.', 'info')
     return redirect(url_for('appointments.pending_appointments'))
 
+# Toplu onay/red: seçilen bekleyen randevular tek işlemde güncellenir
+@appointments_bp.route('/pending/bulk', methods=['POST'])
+@login_required
+def bulk_update_pending():
+    action = request.form.get('action')
+    statuses = {'approve': 'scheduled', 'reject': 'rejected'}
+    try:
+        appointment_ids = [int(value) for value in request.form.getlist('appointment_ids')]
+    except ValueError:
+        appointment_ids = []
+    if action not in statuses or not appointment_ids:
+        flash('Lütfen en az bir randevu ve bir işlem seçin.', 'error')
+        return redirect(url_for('appointments.pending_appointments'))
+
+    # Başka kullanıcının ya da artık beklemede olmayan randevular atlanır
+    appointments = Appointment.query.filter(
+        Appointment.id.in_(appointment_ids),
+        Appointment.user_id == current_user.id,
+        Appointment.status == 'pending'
+    ).all()
+    try:
+        for appointment in appointments:
+            appointment.status = statuses[action]
+        db.session.flush()
+        now = datetime.now()
+        reminders = [(appointment.id, appointment.reminder_due_at) for appointment in appointments
+                     if appointment.reminder_due_at and appointment.reminder_due_at > now]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash('Randevular güncellenirken bir hata oluştu.', 'error')
+        return redirect(url_for('appointments.pending_appointments'))
+
+    if reminders:
+        # Schedule reminder SMS for all approved appointments at once
+        try:
+            from app import get_scheduler_service
+            scheduler = get_scheduler_service()
+            if scheduler:
+                scheduler.schedule_appointment_reminders(reminders)
+        except Exception as e:
+            # Don't fail the approval if reminder scheduling fails
+            print(f"Failed to schedule reminders: {str(e)}")
+
+    if action == 'approve':
+        flash(f'{len(appointments)} randevu onaylandı.', 'success')
+    else:
+        flash(f'{len(appointments)} randevu reddedildi.', 'info')
+    return redirect(url_for('appointments.pending_appointments'))
+
 # --- Öğrenci randevu talep formu (kayıtsız) ---
 @appointments_bp.route('/r/<unique_link>', methods=['GET', 'POST'])
 def public_appointment_request(unique_link):
@@ -43,6 +105,13 @@ def public_appointment_request(unique_link):
     if not user:
         abort(404)
 
+    # Aynı formun tekrar gönderilmesi ikinci bir randevu oluşturmaz
+    idempotency_key = (request.form.get('idempotency_key') or '')[:64] or uuid.uuid4().hex
+
+    def render_form():
+        return render_template('public_appointment_form.html', user=user, today=date.today(),
+                               idempotency_key=idempotency_key, csrf_token=generate_csrf())
+
     if request.method == 'POST':
         name = request.form.get('name')
         phone = request.form.get('phone')
@@ -60,41 +129,75 @@ def public_appointment_request(unique_link):
             errors.append('Tarih seçilmelidir.')
         if not appointment_time:
             errors.append('Saat seçilmelidir.')
+        if not errors:
+            try:
+                appt_date_obj = datetime.strptime(appointment_date, '%Y-%m-%d').date()
+                appt_time_obj = datetime.strptime(appointment_time, '%H:%M').time()
+            except ValueError:
+                errors.append('Geçersiz tarih veya saat.')
 
         if errors:
             for error in errors:
                 flash(error, 'error')
-            return render_template('public_appointment_form.html', user=user, csrf_token=generate_csrf())
+            return render_form()
+
+        # Yalnızca formda sunulan saatler (çalışma günü/saatleri, slot düzeni, geçmiş değil)
+        if not is_offered_slot(user, appt_date_obj, appt_time_obj):
+            flash('Seçilen tarih ve saatte randevu alınamaz, lütfen listeden bir saat seçin.', 'error')
+            return render_form()
 
         # Bloklanmış gün kontrolü
-        appt_date_obj = datetime.strptime(appointment_date, '%Y-%m-%d').date()
-        if BlockedDay.is_date_blocked(user.id, appt_date_obj):
+        if day_schedule_cache.get(user, appt_date_obj).blocked:
             flash('Seçilen tarih bloklanmış! Bu tarihte randevu alınamaz.', 'error')
-            return render_template('public_appointment_form.html', user=user, csrf_token=generate_csrf())
+            return render_form()
 
-        # Appointment kaydı
-        try:
-            appointment = Appointment(
-                user_id=user.id,
-                title=f"{name} - Online Randevu",
-                description=note,
-                appointment_date=appt_date_obj,
-                appointment_time=datetime.strptime(appointment_time, '%H:%M').time(),
-                duration=60,
-                status='pending',
-                location='',
-                notes='',
-            )
-            db.session.add(appointment)
-            db.session.commit()
+        # Appointment kaydı (gün kilidi + çakışma kontrolü tek işlemde)
+        result = book_public_appointment(
+            db, user.id, appt_date_obj, appt_time_obj, user.get_slot_length(),
+            title=f"{name} - Online Randevu",
+            description=note,
+            idempotency_key=idempotency_key
+        )
+        if result['status'] in ('created', 'duplicate'):
             flash('Randevu isteğiniz alınmıştır, eğitmeniniz onayladığında size geri dönüş yapılacaktır.', 'success')
             return redirect(url_for('appointments.public_appointment_request', unique_link=unique_link))
-        except Exception as e:
-            db.session.rollback()
+        if result['status'] == 'conflict':
+            flash('Seçtiğiniz saat az önce doldu, lütfen başka bir saat seçin.', 'error')
+        elif result['status'] == 'blocked':
+            flash('Seçilen tarih bloklanmış! Bu tarihte randevu alınamaz.', 'error')
+        else:
             flash('Bir hata oluştu, lütfen tekrar deneyin.', 'error')
-            return render_template('public_appointment_form.html', user=user, csrf_token=generate_csrf())
+        return render_form()
 
-    return render_template('public_appointment_form.html', user=user, csrf_token=generate_csrf())
+    return render_form()
+
+@appointments_bp.route('/r/<unique_link>/slots')
+def public_available_slots(unique_link):
+    """Online randevu formu için boş saatler (JSON)"""
+    from services.availability import MAX_RANGE_DAYS, get_available_slots, schedule_etag
+
+    user = User.query.filter_by(unique_link=unique_link).first()
+    if not user:
+        abort(404)
+
+    try:
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() \
+            if request.args.get('start') else date.today()
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() \
+            if request.args.get('end') else start_date + timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'Geçersiz tarih formatı.'}), 400
+    if end_date < start_date or (end_date - start_date).days >= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Tarih aralığı en fazla {MAX_RANGE_DAYS} gün olabilir.'}), 400
+
+    etag = schedule_etag(user, start_date, end_date)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(get_available_slots(user, start_date, end_date))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @appointments_bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -142,37 +245,39 @@ def create():
         except ValueError:
             errors.append('Geçersiz süre değeri.')
         
+        # Tekrarlayan randevu
+        recurrence_rule = None
+        repeat = request.form.get('repeat')
+        if repeat:
+            try:
+                repeat_count = int(request.form.get('repeat_count', 0))
+            except ValueError:
+                repeat_count = 0
+            if repeat not in REPEAT_RULES:
+                errors.append('Geçersiz tekrar seçeneği.')
+            elif repeat_count < 2 or repeat_count > MAX_OCCURRENCES:
+                errors.append(f'Tekrar sayısı 2 ile {MAX_OCCURRENCES} arasında olmalıdır.')
+            else:
+                recurrence_rule = f"{REPEAT_RULES[repeat]};COUNT={repeat_count}"
+        
         if errors:
             for error in errors:
                 flash(error, 'error')
             return render_template('appointments/create.html', date=date)
         
+        if recurrence_rule:
+            return _create_series(title, description, appointment_date, appointment_time,
+                                  duration, location, notes, recurrence_rule)
+        
         # Bloklanmış gün kontrolü
-    # importlar dosya başında
-        if BlockedDay.is_date_blocked(current_user.id, appointment_date):
+        day_schedule = day_schedule_cache.get(current_user, appointment_date)
+        if day_schedule.blocked:
             flash('Seçilen tarih bloklanmış! Bu tarihte randevu alınamaz.', 'error')
             return render_template('appointments/create.html', date=date)
         
         # Çakışma kontrolü
-        existing_appointment = Appointment.query.filter(
-            Appointment.user_id == current_user.id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.status != 'cancelled'
-        ).filter(
-            # Zaman çakışması kontrolü
-            db.or_(
-                # Yeni randevunun başlangıcı mevcut randevunun içinde
-                db.and_(
-                    Appointment.appointment_time <= appointment_time,
-                    db.func.time(Appointment.appointment_time, f'+{duration} minutes') > appointment_time
-                ),
-                # Yeni randevunun bitişi mevcut randevunun içinde
-                db.and_(
-                    appointment_time < db.func.time(Appointment.appointment_time, f'+{Appointment.duration} minutes'),
-                    db.func.time(appointment_time, f'+{duration} minutes') > Appointment.appointment_time
-                )
-            )
-        ).first()
+        start_minute = to_minutes(appointment_time)
+        existing_appointment = day_schedule.find_conflict(start_minute, start_minute + duration)
         
         if existing_appointment:
             flash('Bu saatte zaten bir randevunuz var!', 'error')
@@ -200,11 +305,10 @@ def create():
                 from app import get_scheduler_service
                 scheduler = get_scheduler_service()
                 if scheduler:
-                    appointment_datetime = appointment.get_datetime()
-                    reminder_time = appointment_datetime - timedelta(hours=24)
+                    reminder_time = appointment.reminder_due_at
                     
                     # Only schedule if reminder time is in the future
-                    if reminder_time > datetime.now():
+                    if reminder_time and reminder_time > datetime.now():
                         scheduler.schedule_appointment_reminder(appointment.id, reminder_time)
             except Exception as e:
                 # Don't fail appointment creation if reminder scheduling fails
@@ -218,6 +322,46 @@ def create():
     
     return render_template('appointments/create.html', date=date)
 
+def _create_series(title, description, appointment_date, appointment_time, duration, location, notes, recurrence_rule):
+    """Tekrarlayan randevunun tüm tekrarlarını tek işlemde oluştur"""
+    occurrences = expand_rule(recurrence_rule, appointment_date)
+    result = create_appointment_series(
+        db, current_user.id, occurrences, appointment_time, duration, recurrence_rule,
+        title=title,
+        description=description,
+        location=location,
+        notes=notes
+    )
+    
+    if result['status'] == 'created':
+        # Schedule reminder SMS for the occurrences still ahead
+        try:
+            from app import get_scheduler_service
+            scheduler = get_scheduler_service()
+            if scheduler:
+                now = datetime.now()
+                scheduler.schedule_appointment_reminders(
+                    [(appointment_id, reminder_time) for appointment_id, reminder_time in result['reminders']
+                     if reminder_time > now]
+                )
+        except Exception as e:
+            # Don't fail appointment creation if reminder scheduling fails
+            print(f"Failed to schedule reminders: {str(e)}")
+        
+        flash(f'{len(occurrences)} randevuluk seri başarıyla oluşturuldu!', 'success')
+        return redirect(url_for('dashboard.appointments'))
+    
+    if result['status'] == 'blocked':
+        flash('Serideki şu tarihler bloklanmış: ' +
+              ', '.join(day.strftime('%d.%m.%Y') for day in result['blocked']), 'error')
+    elif result['status'] == 'conflict':
+        flash('Serideki şu tarihlerde zaten randevunuz var: ' +
+              ', '.join(f"{day.strftime('%d.%m.%Y')} {start.strftime('%H:%M')} ({other_title})"
+                        for day, start, other_title in result['conflicts']), 'error')
+    else:
+        flash('Randevu oluşturulurken bir hata oluştu.', 'error')
+    return render_template('appointments/create.html', date=date)
+
 @appointments_bp.route('/<int:appointment_id>')
 @login_required
 def view(appointment_id):
@@ -287,11 +431,10 @@ def edit(appointment_id):
                     from app import get_scheduler_service
                     scheduler = get_scheduler_service()
                     if scheduler:
-                        appointment_datetime = appointment.get_datetime()
-                        reminder_time = appointment_datetime - timedelta(hours=24)
+                        reminder_time = appointment.reminder_due_at
                         
                         # Only reschedule if reminder time is in the future
-                        if reminder_time > datetime.now():
+                        if reminder_time and reminder_time > datetime.now():
                             scheduler.reschedule_appointment_reminder(appointment.id, reminder_time)
                         else:
                             # Remove reminder if it's too late
@@ -365,10 +508,9 @@ def update_status(appointment_id):
             if scheduler:
                 if new_status == 'scheduled':
                     # Schedule reminder for newly scheduled appointment
-                    appointment_datetime = appointment.get_datetime()
-                    reminder_time = appointment_datetime - timedelta(hours=24)
+                    reminder_time = appointment.reminder_due_at
                     
-                    if reminder_time > datetime.now():
+                    if reminder_time and reminder_time > datetime.now():
                         scheduler.schedule_appointment_reminder(appointment.id, reminder_time)
                 else:
                     # Remove reminder for cancelled/completed appointments
@@ -395,34 +537,17 @@ def check_conflict():
     duration = int(data['duration'])
     exclude_id = data.get('exclude_id')  # Düzenleme sırasında mevcut randevuyu hariç tut
     
-    # Çakışma kontrolü
-    query = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.appointment_date == appointment_date,
-        Appointment.status != 'cancelled'
+    # Çakışma kontrolü (günün randevuları önbellekten)
+    start_minute = to_minutes(appointment_time)
+    conflict = day_schedule_cache.get(current_user, appointment_date).find_conflict(
+        start_minute, start_minute + duration, exclude_id=int(exclude_id) if exclude_id else None
     )
     
-    if exclude_id:
-        query = query.filter(Appointment.id != exclude_id)
-    
-    conflicting_appointment = query.filter(
-        db.or_(
-            db.and_(
-                Appointment.appointment_time <= appointment_time,
-                db.func.time(Appointment.appointment_time, f'+{Appointment.duration} minutes') > appointment_time
-            ),
-            db.and_(
-                appointment_time < db.func.time(Appointment.appointment_time, f'+{Appointment.duration} minutes'),
-                db.func.time(appointment_time, f'+{duration} minutes') > Appointment.appointment_time
-            )
-        )
-    ).first()
-    
     return jsonify({
-        'has_conflict': conflicting_appointment is not None,
+        'has_conflict': conflict is not None,
         'conflicting_appointment': {
-            'title': conflicting_appointment.title,
-            'time': conflicting_appointment.appointment_time.strftime('%H:%M'),
-            'duration': conflicting_appointment.duration
-        } if conflicting_appointment else None
+            'title': conflict[3],
+            'time': format_minutes(conflict[0]),
+            'duration': conflict[1] - conflict[0]
+        } if conflict else None
     })
@@ -210,6 +210,28 @@ def edit_profile():
         current_user.phone = request.form.get('phone', current_user.phone)
         current_user.company_name = request.form.get('company_name', current_user.company_name)
         current_user.updated_at = datetime.utcnow()
+
+        # Online randevu ayarları
+        work_start = request.form.get('work_start')
+        work_end = request.form.get('work_end')
+        slot_length = request.form.get('slot_length')
+        if work_start or work_end or slot_length:
+            try:
+                work_start = datetime.strptime(work_start, '%H:%M').time()
+                work_end = datetime.strptime(work_end, '%H:%M').time()
+                slot_length = int(slot_length)
+            except (TypeError, ValueError):
+                flash('Geçersiz çalışma saati veya slot süresi.', 'error')
+                return render_template('auth/edit_profile.html', user=current_user, csrf_token=generate_csrf)
+            if work_start >= work_end or not 15 <= slot_length <= 480:
+                flash('Çalışma saatleri geçersiz ya da slot süresi 15-480 dakika aralığında değil.', 'error')
+                return render_template('auth/edit_profile.html', user=current_user, csrf_token=generate_csrf)
+            current_user.work_start = work_start
+            current_user.work_end = work_end
+            current_user.slot_length = slot_length
+            current_user.work_days = ','.join(
+                day for day in request.form.getlist('work_days') if day in ('0', '1', '2', '3', '4', '5', '6')
+            )
         # unique_link alanı asla değişmesin/silinmesin
         if not current_user.unique_link:
             import random, string
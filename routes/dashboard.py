@@ -3,63 +3,26 @@ from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta
 from models import User, Appointment, SmsLog, BlockedDay, db, Client
 from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import load_only
+from services.dashboard import get_dashboard_summary
+from services.statistics import get_appointment_statistics
+from services.stats_cache import stats_cache
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Takvim API'sinin tek istekte döndürebileceği en uzun aralık (gün)
+MAX_CALENDAR_RANGE_DAYS = 62
+
 @dashboard_bp.route('/')
 @login_required
 def dashboard():
     """Ana dashboard sayfası"""
-    from models import User, Appointment, SmsLog, BlockedDay, db, Client
-    from sqlalchemy import func
-    from datetime import date
-    from datetime import date
-    
-    user = current_user
-    
-    # Bugünkü randevular
-    today_appointments = Appointment.get_today_appointments(user.id)
-    
-    # Yaklaşan randevular
-    upcoming_appointments = Appointment.get_upcoming_appointments(user.id, limit=5)
-    
-    # İstatistikler
-    total_appointments = user.get_appointments_count()
-    today_count = len(today_appointments)
-    upcoming_count = len(Appointment.query.filter(
-        Appointment.user_id == user.id,
-        Appointment.appointment_date >= date.today(),
-        Appointment.status == 'scheduled'
-    ).all())
-    
-    # Bu ayın randevuları
-    start_of_month = date.today().replace(day=1)
-    end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-    
-    monthly_appointments = Appointment.query.filter(
-        Appointment.user_id == user.id,
-        Appointment.appointment_date >= start_of_month,
-        Appointment.appointment_date <= end_of_month
-    ).all()
-    
-    # Durum istatistikleri
-    status_stats = db.session.query(
-        Appointment.status,
-        func.count(Appointment.id)
-    ).filter(
-        Appointment.user_id == user.id
-    ).group_by(Appointment.status).all()
-    
-    status_counts = {status: count for status, count in status_stats}
+    user_id = current_user.id
+    summary = stats_cache.get_or_compute(user_id, f'dashboard:{date.today().isoformat()}',
+                                         lambda: get_dashboard_summary(user_id))
     
     return render_template('dashboard/index.html',
-                         today_appointments=today_appointments,
-                         upcoming_appointments=upcoming_appointments,
-                         total_appointments=total_appointments,
-                         today_count=today_count,
-                         upcoming_count=upcoming_count,
-                         monthly_appointments=monthly_appointments,
-                         status_counts=status_counts,
+                         summary=summary,
                          date_util=date)
 
 @dashboard_bp.route('/appointments')
@@ -115,114 +78,80 @@ def appointments():
 @dashboard_bp.route('/calendar')
 @login_required
 def calendar():
-    """Takvim görünümü"""
-    # Bu ayın randevuları
-    today = date.today()
-    start_of_month = today.replace(day=1)
-    
-    # Bir sonraki ayın başlangıcı
-    if start_of_month.month == 12:
-        next_month = start_of_month.replace(year=start_of_month.year + 1, month=1)
-    else:
-        next_month = start_of_month.replace(month=start_of_month.month + 1)
-    
-    # Bu ayın randevuları
-    monthly_appointments = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.appointment_date >= start_of_month,
-        Appointment.appointment_date < next_month
-    ).order_by(Appointment.appointment_date.asc()).all()
-    
-    # Tarihe göre grupla
-    appointments_by_date = {}
-    for appointment in monthly_appointments:
-        date_str = appointment.appointment_date.strftime('%Y-%m-%d')
-        if date_str not in appointments_by_date:
-            appointments_by_date[date_str] = []
-        appointments_by_date[date_str].append(appointment)
-    
-    return render_template('dashboard/calendar.html',
-                         appointments_by_date=appointments_by_date,
-                         current_month=start_of_month,
-                         date_util=date)
+    """Takvim görünümü (randevular /api/calendar üzerinden yüklenir)"""
+    return render_template('dashboard/calendar.html', date_util=date)
 
-@dashboard_bp.route('/stats')
+@dashboard_bp.route('/api/calendar')
 @login_required
-def stats():
-    """İstatistikler sayfası"""
-    user = current_user
-
-    # Genel istatistikler
-    total_appointments = Appointment.query.filter_by(user_id=user.id).count()
-    completed_appointments = Appointment.query.filter_by(user_id=user.id, status='completed').count()
-    scheduled_appointments = Appointment.query.filter_by(user_id=user.id, status='scheduled').count()
-    cancelled_appointments = Appointment.query.filter_by(user_id=user.id, status='cancelled').count()
-
-    # Bu yılın istatistikleri
-    current_year = datetime.now().year
-    yearly_appointments = Appointment.query.filter(
-        Appointment.user_id == user.id,
-        func.extract('year', Appointment.appointment_date) == current_year
-    ).all()
-
-    # Aylık dağılım
-    monthly_stats = {}
-    for appointment in yearly_appointments:
-        month = appointment.appointment_date.month
-        if month not in monthly_stats:
-            monthly_stats[month] = 0
-        monthly_stats[month] += 1
-
-    # Chart için labels ve data
-    monthly_labels = [f'{month}.Ay' for month in sorted(monthly_stats.keys())]
-    monthly_data = [monthly_stats[month] for month in sorted(monthly_stats.keys())]
-
-    # Durum istatistikleri
-    status_stats = db.session.query(
-        Appointment.status,
-        func.count(Appointment.id)
-    ).filter(
-        Appointment.user_id == user.id
-    ).group_by(Appointment.status).all()
+def calendar_api():
+    """
+    Takvimde görünen aralığın randevuları (JSON)
+    
+    start dahil, end hariç (FullCalendar'ın gönderdiği ISO tarih/saat de kabul edilir).
+    Yalnızca takvimin kullandığı kolonlar yüklenir; sorgu
+    ix_appointment_user_calendar indeksinden karşılanır.
+    """
+    try:
+        start_date = datetime.strptime(request.args.get('start', '')[:10], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end', '')[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start ve end YYYY-MM-DD formatında olmalıdır'}), 400
+    if end_date <= start_date or (end_date - start_date).days > MAX_CALENDAR_RANGE_DAYS:
+        return jsonify({'error': f'Aralık 1 ile {MAX_CALENDAR_RANGE_DAYS} gün arasında olmalıdır'}), 400
 
-    # En çok randevu olan günler
-    busiest_days = []
-    busy_days = db.session.query(
+    appointments = Appointment.query.options(load_only(
+        Appointment.id,
+        Appointment.title,
         Appointment.appointment_date,
-        func.count(Appointment.id).label('count')
-    ).filter(
-        Appointment.user_id == user.id
-    ).group_by(Appointment.appointment_date).order_by(
-        func.count(Appointment.id).desc()
-    ).limit(10).all()
-    for day, count in busy_days:
-        busiest_days.append((day.strftime('%d.%m.%Y'), count))
+        Appointment.appointment_time,
+        Appointment.duration,
+        Appointment.status
+    )).filter(
+        Appointment.user_id == current_user.id,
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date < end_date
+    ).order_by(Appointment.appointment_date.asc(), Appointment.appointment_time.asc()).all()
 
-    # En aktif saatler
-    busiest_hours = []
-    hour_stats = db.session.query(
-        func.strftime('%H', Appointment.appointment_time),
-        func.count(Appointment.id)
-    ).filter(
-        Appointment.user_id == user.id
-    ).group_by(func.strftime('%H', Appointment.appointment_time)).order_by(func.count(Appointment.id).desc()).limit(10).all()
-    for hour, count in hour_stats:
-        busiest_hours.append((hour, count))
+    return jsonify({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'appointments': [{
+            'id': appointment.id,
+            'title': appointment.title,
+            'date': appointment.appointment_date.isoformat(),
+            'time': appointment.appointment_time.strftime('%H:%M'),
+            'duration': appointment.duration if appointment.duration is not None else 60,
+            'status': appointment.status
+        } for appointment in appointments]
+    })
 
-    stats = {
-        'total_appointments': total_appointments,
-        'completed_appointments': completed_appointments,
-        'scheduled_appointments': scheduled_appointments,
-        'cancelled_appointments': cancelled_appointments,
-        'busiest_days': busiest_days,
-        'busiest_hours': busiest_hours
-    }
+@dashboard_bp.route('/stats')
+@login_required
+def stats():
+    """İstatistikler sayfası (varsayılan: bu yıl)"""
+    user_id = current_user.id
+    today = date.today()
+    start_date, end_date = today.replace(month=1, day=1), today.replace(month=12, day=31)
+    try:
+        if request.args.get('start'):
+            start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        if request.args.get('end'):
+            end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Geçersiz tarih formatı!', 'error')
+    if end_date < start_date:
+        flash('Bitiş tarihi başlangıç tarihinden önce olamaz!', 'error')
+        start_date, end_date = today.replace(month=1, day=1), today.replace(month=12, day=31)
+
+    statistics = stats_cache.get_or_compute(
+        user_id, f'stats:{start_date.isoformat()}:{end_date.isoformat()}',
+        lambda: get_appointment_statistics(user_id, start_date, end_date)
+    )
 
     return render_template('dashboard/stats.html',
-                         stats=stats,
-                         monthly_labels=monthly_labels,
-                         monthly_data=monthly_data,
-                         current_year=current_year,
+                         statistics=statistics,
+                         monthly_labels=[f'{month:02d}.{year}' for year, month, _ in statistics.monthly],
+                         monthly_data=[count for _, _, count in statistics.monthly],
                          date_util=date)
 
 @dashboard_bp.route('/blocked-days')
@@ -0,0 +1,159 @@
+"""
+Free appointment slots for the public booking form
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple
+
+# Longest date range one availability request may cover
+MAX_RANGE_DAYS = 62
+
+
+def merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merge overlapping or touching intervals
+
+    Args:
+        intervals: (start, end) pairs sorted by start
+
+    Returns:
+        Disjoint intervals sorted by start (and therefore by end)
+    """
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(day_start: int, day_end: int, slot_length: int,
+               busy: List[Tuple[int, int]], not_before: int = None) -> List[int]:
+    """
+    Slot start minutes on the working-hours grid that do not hit a busy interval
+
+    Both the grid and the merged busy intervals are sorted, so one sweep
+    with a single pointer into ``busy`` checks every slot.
+
+    Args:
+        day_start: First minute of working hours
+        day_end: Minute working hours end
+        slot_length: Slot length in minutes
+        busy: (start, end) intervals sorted by start
+        not_before: Drop slots starting before this minute (today)
+    """
+    merged = merge_intervals(busy)
+    slots = []
+    index = 0
+    start = day_start
+    while start + slot_length <= day_end:
+        end = start + slot_length
+        # Skip busy intervals that ended before this slot
+        while index < len(merged) and merged[index][1] <= start:
+            index += 1
+        overlaps = index < len(merged) and merged[index][0] < end
+        if not overlaps and (not_before is None or start >= not_before):
+            slots.append(start)
+        start = end
+    return slots
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def schedule_etag(user, start_date, end_date, now: datetime = None) -> str:
+    """
+    ETag of an availability response
+
+    Changes when the user's schedule (appointments, blocked days) or
+    booking settings change, and when a slot of today moves into the past.
+    Computing it needs no query beyond the user row.
+    """
+    now = now or datetime.now()
+    day_start, day_end = user.get_working_minutes()
+    slot_length = user.get_slot_length()
+    past_slots = 0
+    if start_date <= now.date() <= end_date:
+        past_slots = max(0, (now.hour * 60 + now.minute - day_start) // slot_length + 1)
+    key = ':'.join(str(part) for part in (
+        user.id, user.schedule_version, day_start, day_end, user.work_days, slot_length,
+        start_date, end_date, now.date(), past_slots
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def is_offered_slot(user, day, start_time, now: datetime = None) -> bool:
+    """
+    Whether the public booking form offers a slot starting at this time
+
+    Applies the same working days, working hours, slot grid and past-time
+    rules as get_available_slots(), without its queries. Busy intervals
+    and blocked days are left to the booking transaction, which checks
+    them under the day lock.
+    """
+    now = now or datetime.now()
+    if day < now.date() or day.weekday() not in user.get_work_days():
+        return False
+    day_start, day_end = user.get_working_minutes()
+    not_before = now.hour * 60 + now.minute + 1 if day == now.date() else None
+    minute = start_time.hour * 60 + start_time.minute
+    return start_time.second == 0 and minute in free_slots(
+        day_start, day_end, user.get_slot_length(), [], not_before
+    )
+
+
+def get_available_slots(user, start_date, end_date, now: datetime = None) -> Dict[str, Any]:
+    """
+    Free slots of a user for every day between two dates (inclusive)
+
+    Busy intervals for the whole range come from one index range query on
+    (user_id, appointment_date, start_minute); blocked days from one more.
+
+    Returns:
+        Dict with slot_length and a list of days, each with date, blocked,
+        working and slots ('HH:MM' start times)
+    """
+    from models import Appointment, BlockedDay, NON_BLOCKING_STATUSES, db
+
+    now = now or datetime.now()
+    day_start, day_end = user.get_working_minutes()
+    slot_length = user.get_slot_length()
+    work_days = user.get_work_days()
+
+    busy_by_day = {}
+    for appointment_date, start_minute, end_minute in db.session.query(
+        Appointment.appointment_date, Appointment.start_minute, Appointment.end_minute
+    ).filter(
+        Appointment.user_id == user.id,
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status.notin_(NON_BLOCKING_STATUSES)
+    ).order_by(Appointment.appointment_date.asc(), Appointment.start_minute.asc()):
+        busy_by_day.setdefault(appointment_date, []).append((start_minute, end_minute))
+
+    blocked = {blocked_date for (blocked_date,) in db.session.query(BlockedDay.date).filter(
+        BlockedDay.user_id == user.id,
+        BlockedDay.date >= start_date,
+        BlockedDay.date <= end_date
+    )}
+
+    days = []
+    day = start_date
+    while day <= end_date:
+        working = day.weekday() in work_days and day >= now.date()
+        slots = []
+        if working and day not in blocked:
+            not_before = now.hour * 60 + now.minute + 1 if day == now.date() else None
+            slots = free_slots(day_start, day_end, slot_length, busy_by_day.get(day, []), not_before)
+        days.append({
+            'date': day.isoformat(),
+            'blocked': day in blocked,
+            'working': working,
+            'slots': [format_minutes(minute) for minute in slots]
+        })
+        day += timedelta(days=1)
+
+    return {'slot_length': slot_length, 'days': days}
@@ -0,0 +1,156 @@
+"""
+Transactional booking of public appointment requests and appointment series
+"""
+import logging
+import uuid
+from datetime import date
+from typing import Dict, Any, List
+
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+
+def book_public_appointment(db, user_id: int, appointment_date, appointment_time, duration: int,
+                            title: str, description: str = None, idempotency_key: str = None) -> Dict[str, Any]:
+    """
+    Create a pending appointment unless its slot is taken
+
+    The (user, day) booking lock is written before anything is read, so
+    concurrent requests for the same day run their conflict check one at a
+    time and only the first of two overlapping requests is inserted.
+    Writing first also matters on SQLite, where a transaction that has
+    already read cannot take the write lock once another writer committed.
+    A submission carrying an idempotency key that was already booked
+    returns the existing appointment instead of a new row.
+
+    The current transaction is committed first; objects loaded earlier in
+    the request are reloaded on their next access.
+
+    Returns:
+        Dict with status ('created', 'duplicate', 'conflict', 'blocked' or
+        'failed') and the appointment for created/duplicate
+    """
+    from models import Appointment, BlockedDay, BookingLock, to_minutes
+
+    session = db.session
+    try:
+        session.commit()
+        BookingLock.acquire(session.connection(), user_id, appointment_date)
+
+        if idempotency_key:
+            existing = Appointment.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+            if existing:
+                session.rollback()
+                return {'status': 'duplicate', 'appointment': existing}
+
+        if BlockedDay.is_date_blocked(user_id, appointment_date):
+            session.rollback()
+            return {'status': 'blocked', 'appointment': None}
+
+        start_minute = to_minutes(appointment_time)
+        if Appointment.find_conflict(user_id, appointment_date, start_minute, start_minute + duration):
+            session.rollback()
+            return {'status': 'conflict', 'appointment': None}
+
+        appointment = Appointment(
+            user_id=user_id,
+            title=title,
+            description=description,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            duration=duration,
+            status='pending',
+            location='',
+            notes='',
+            idempotency_key=idempotency_key
+        )
+        session.add(appointment)
+        session.commit()
+        return {'status': 'created', 'appointment': appointment}
+
+    except IntegrityError:
+        # Same idempotency key committed by a concurrent request
+        session.rollback()
+        existing = Appointment.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first() \
+            if idempotency_key else None
+        if existing:
+            return {'status': 'duplicate', 'appointment': existing}
+        logger.error(f"Booking for user {user_id} on {appointment_date} failed on a constraint")
+        return {'status': 'failed', 'appointment': None}
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Booking for user {user_id} on {appointment_date} failed: {str(e)}")
+        return {'status': 'failed', 'appointment': None}
+
+
+def create_appointment_series(db, user_id: int, dates: List[date], appointment_time, duration: int,
+                              recurrence_rule: str, status: str = 'scheduled', **fields) -> Dict[str, Any]:
+    """
+    Create every occurrence of a recurring appointment, or none of them
+
+    The booking locks of all days are taken with one UPDATE, then one
+    range query finds the existing appointments
+    overlapping any occurrence and one more the blocked days in the span.
+    All occurrences are inserted in the same transaction; their reminder
+    schedule (reminder_due_at) is set by the insert itself.
+
+    Args:
+        dates: Occurrence dates, e.g. from services.recurrence.expand_rule
+        fields: Other Appointment columns (title, description, location, ...)
+
+    Returns:
+        Dict with status ('created', 'conflict', 'blocked' or 'failed'),
+        the created appointments with their (id, reminder_due_at)
+        reminders, the conflicting appointments as (date, time, title)
+        and the blocked dates
+    """
+    from models import Appointment, BlockedDay, BookingLock, to_minutes
+
+    result = {'status': 'failed', 'appointments': [], 'reminders': [], 'conflicts': [], 'blocked': []}
+    dates = sorted(set(dates))
+    session = db.session
+    try:
+        session.commit()
+        BookingLock.acquire_many(session.connection(), user_id, dates)
+
+        wanted = set(dates)
+        result['blocked'] = [blocked_day.date for blocked_day in
+                             BlockedDay.get_blocked_days_for_user(user_id, dates[0], dates[-1])
+                             if blocked_day.date in wanted]
+        start_minute = to_minutes(appointment_time)
+        result['conflicts'] = [
+            (appointment.appointment_date, appointment.appointment_time, appointment.title)
+            for appointment in Appointment.find_conflicts(user_id, dates, start_minute, start_minute + duration)
+        ]
+        if result['blocked'] or result['conflicts']:
+            session.rollback()
+            result['status'] = 'blocked' if result['blocked'] else 'conflict'
+            return result
+
+        series_id = uuid.uuid4().hex
+        appointments = [
+            Appointment(
+                user_id=user_id,
+                appointment_date=day,
+                appointment_time=appointment_time,
+                duration=duration,
+                status=status,
+                series_id=series_id,
+                recurrence_rule=recurrence_rule,
+                **fields
+            )
+            for day in dates
+        ]
+        session.add_all(appointments)
+        session.flush()
+        reminders = [(appointment.id, appointment.reminder_due_at) for appointment in appointments
+                     if appointment.reminder_due_at is not None]
+        session.commit()
+        result.update(status='created', appointments=appointments, reminders=reminders)
+        return result
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Creating a series of {len(dates)} appointments for user {user_id} failed: {str(e)}")
+        return result
@@ -0,0 +1,89 @@
+"""
+Circuit breaker for calls to the SMS provider
+"""
+import threading
+import time
+from typing import Dict, Any
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    allow_request() returns False for ``reset_timeout`` seconds. The first
+    caller after that is let through as a probe (half-open); its outcome
+    closes the circuit again or re-opens it for another ``reset_timeout``.
+    A probe that ends without an outcome must call release() so that the
+    next caller can probe instead.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_owner = None
+        self._short_circuited = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go to the provider now"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_owner = threading.get_ident()
+                return True
+            self._short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Free the probe slot held by this thread if no outcome was recorded"""
+        with self._lock:
+            if self._probe_in_flight and self._probe_owner == threading.get_ident():
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'short_circuited': self._short_circuited,
+                'retry_in_seconds': round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else 0.0
+            }
@@ -0,0 +1,70 @@
+"""
+Per-user dashboard figures
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import case, func
+
+
+@dataclass
+class DashboardSummary:
+    """Counters and short lists shown on a user's dashboard"""
+    total_count: int = 0
+    today_count: int = 0
+    upcoming_count: int = 0
+    monthly_count: int = 0
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    today_appointments: List = field(default_factory=list)
+    upcoming_appointments: List = field(default_factory=list)
+
+
+def get_dashboard_counts(user_id: int, today: date = None) -> DashboardSummary:
+    """
+    Dashboard counters of a user from one aggregate query
+
+    The counts are conditional sums grouped by status, so the status
+    breakdown and every total come from the same scan of the user's
+    appointments. The returned summary has empty lists.
+    """
+    from models import Appointment, db
+
+    today = today or date.today()
+    start_of_month = today.replace(day=1)
+    next_month = (start_of_month + timedelta(days=32)).replace(day=1)
+
+    def count_where(*conditions):
+        return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
+    rows = db.session.query(
+        Appointment.status,
+        func.count(Appointment.id),
+        count_where(Appointment.appointment_date == today),
+        count_where(Appointment.appointment_date >= today, Appointment.status == 'scheduled'),
+        count_where(Appointment.appointment_date >= start_of_month, Appointment.appointment_date < next_month)
+    ).filter(
+        Appointment.user_id == user_id
+    ).group_by(Appointment.status).all()
+
+    summary = DashboardSummary()
+    for status, total, today_count, upcoming_count, monthly_count in rows:
+        summary.status_counts[status] = total
+        summary.total_count += total
+        summary.today_count += today_count
+        summary.upcoming_count += upcoming_count
+        summary.monthly_count += monthly_count
+    return summary
+
+
+def get_dashboard_summary(user_id: int, upcoming_limit: int = 5) -> DashboardSummary:
+    """
+    Everything the dashboard page shows: one aggregate query plus the
+    today and upcoming lists
+    """
+    from models import Appointment
+
+    summary = get_dashboard_counts(user_id)
+    summary.today_appointments = Appointment.get_today_appointments(user_id)
+    summary.upcoming_appointments = Appointment.get_upcoming_appointments(user_id, limit=upcoming_limit)
+    return summary
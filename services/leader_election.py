@@ -0,0 +1,204 @@
+"""
+Leader election for the reminder scheduler using a database lease row
+"""
+import os
+import socket
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+class LeaderElector:
+    """
+    Elects a single process to run the reminder scheduler
+
+    Every candidate process tries to hold the same ``scheduler_lease`` row.
+    The holder renews it every ``ttl / 3`` seconds; when it stops renewing
+    (crash, shutdown, lost database) the lease expires after ``ttl`` seconds
+    and another candidate takes over. Only plain UPDATE/INSERT statements
+    are used, so it works the same on SQLite and PostgreSQL. Clocks of the
+    candidate hosts are assumed to be roughly in sync.
+
+    ``on_elected`` runs on its own thread so that a slow start-up keeps
+    being covered by renewals. A renewal that fails with a database error
+    is retried on the next tick; the leader only steps down once its lease
+    could expire before that tick.
+    """
+
+    def __init__(self, db, app, name: str = 'reminder-scheduler', ttl: int = 30,
+                 on_elected: Optional[Callable[[], None]] = None,
+                 on_demoted: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.app = app
+        self.name = name
+        self.ttl = timedelta(seconds=ttl)
+        self.renew_interval = max(1.0, ttl / 3)
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._renewed_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._startup_thread = None
+
+    def try_acquire(self) -> bool:
+        """
+        Acquire or renew the lease
+
+        Returns:
+            True if this process holds the lease after the call, False if
+            another candidate holds it, None if the check itself failed
+        """
+        from models import SchedulerLease
+
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                # Renew our own lease, or take over an expired one
+                renewed = SchedulerLease.query.filter(
+                    SchedulerLease.name == self.name,
+                    SchedulerLease.holder == self.holder_id
+                ).update({'expires_at': expires_at}, synchronize_session=False)
+
+                if not renewed:
+                    renewed = SchedulerLease.query.filter(
+                        SchedulerLease.name == self.name,
+                        SchedulerLease.expires_at < now
+                    ).update({
+                        'holder': self.holder_id,
+                        'expires_at': expires_at,
+                        'acquired_at': now
+                    }, synchronize_session=False)
+
+                if renewed:
+                    session.commit()
+                    return True
+
+                if session.get(SchedulerLease, self.name) is not None:
+                    # Someone else holds a live lease
+                    session.rollback()
+                    return False
+
+                # First election ever: create the lease row
+                session.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.holder_id,
+                    expires_at=expires_at,
+                    acquired_at=now
+                ))
+                session.commit()
+                return True
+
+            except IntegrityError:
+                # Another candidate created the row first
+                session.rollback()
+                return False
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Lease '{self.name}' check failed: {str(e)}")
+                return None
+
+    def release(self):
+        """Expire our lease so that another candidate can take over at once"""
+        from models import SchedulerLease
+
+        with self.app.app_context():
+            try:
+                SchedulerLease.query.filter(
+                    SchedulerLease.name == self.name,
+                    SchedulerLease.holder == self.holder_id
+                ).update({'expires_at': datetime.utcnow()}, synchronize_session=False)
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                logger.error(f"Failed to release lease '{self.name}': {str(e)}")
+
+    def start(self):
+        """Start campaigning in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"leader-election-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Joined leader election for '{self.name}' as {self.holder_id}")
+
+    def stop(self):
+        """Stop campaigning, step down and release the lease"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.renew_interval + 5)
+        if self.is_leader:
+            self._step_down()
+            self.release()
+
+    def _run(self):
+        """Acquire/renew loop"""
+        while not self._stop_event.is_set():
+            self._tick()
+            self._stop_event.wait(self.renew_interval)
+
+    def _tick(self):
+        acquired = self.try_acquire()
+        if acquired is None:
+            # Transient database error: the lease we hold stays valid until
+            # ttl after the last renewal, keep leading while the next tick
+            # can still renew it in time
+            if not self.is_leader:
+                return
+            deadline = self._renewed_at + self.ttl.total_seconds()
+            if time.monotonic() + self.renew_interval < deadline:
+                logger.warning(f"Lease '{self.name}' renewal failed, retrying on the next tick")
+                return
+            acquired = False
+        elif acquired:
+            self._renewed_at = time.monotonic()
+
+        if acquired and not self.is_leader:
+            logger.info(f"Elected leader for '{self.name}' ({self.holder_id})")
+            self.is_leader = True
+            if self.on_elected:
+                self._startup_thread = threading.Thread(
+                    target=self._run_on_elected,
+                    name=f"leader-startup-{self.name}",
+                    daemon=True
+                )
+                self._startup_thread.start()
+        elif not acquired and self.is_leader:
+            logger.warning(f"Lost leadership for '{self.name}' ({self.holder_id})")
+            self._step_down()
+
+    def _run_on_elected(self):
+        """Leader start-up, run beside the renew loop"""
+        try:
+            self.on_elected()
+        except Exception as e:
+            logger.error(f"Leader start-up failed, stepping down: {str(e)}")
+            if self.is_leader:
+                self._step_down()
+                self.release()
+
+    def _step_down(self):
+        self.is_leader = False
+        # A start-up still in progress finishes first, so that on_demoted
+        # stops whatever it started
+        startup = self._startup_thread
+        if startup and startup.is_alive() and startup is not threading.current_thread():
+            startup.join()
+        if self.on_demoted:
+            try:
+                self.on_demoted()
+            except Exception as e:
+                logger.error(f"Leader shutdown failed: {str(e)}")
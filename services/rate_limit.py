@@ -0,0 +1,145 @@
+"""
+Token-bucket rate limiting for outbound SMS
+"""
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Callers over the limit are not rejected: acquire() reserves its tokens
+    immediately (the balance may go negative) and sleeps until the bucket
+    has refilled enough to cover them. Concurrent callers therefore queue
+    up in the order they arrived, each waiting for its own share.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket without waiting
+
+        Returns:
+            Seconds the caller must wait before the tokens are available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, sleeping while it is over the limit
+
+        Returns:
+            Seconds spent waiting
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class WaitStats:
+    """Queue wait-time counters for one kind of bucket"""
+
+    def __init__(self):
+        self.messages = 0
+        self.calls = 0
+        self.delayed_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, tokens: int, wait: float):
+        with self._lock:
+            self.messages += tokens
+            self.calls += 1
+            if wait > 0:
+                self.delayed_calls += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'messages': self.messages,
+                'calls': self.calls,
+                'delayed_calls': self.delayed_calls,
+                'total_wait_seconds': round(self.total_wait, 3),
+                'max_wait_seconds': round(self.max_wait, 3),
+                'avg_wait_seconds': round(self.total_wait / self.delayed_calls, 3) if self.delayed_calls else 0.0
+            }
+
+
+class SmsRateLimiter:
+    """
+    Provider-wide and per-tenant token buckets in front of the SMS provider
+
+    A rate of 0 disables the corresponding limit. The tenant bucket is
+    taken first so a tenant that is over its own limit does not hold
+    provider capacity while it waits.
+    """
+
+    def __init__(self, provider_rate: float, provider_burst: float,
+                 tenant_rate: float, tenant_burst: float):
+        self.provider = TokenBucket(provider_rate, provider_burst) if provider_rate > 0 else None
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = tenant_burst
+        self._tenants: Dict[Any, TokenBucket] = {}
+        self._tenants_lock = threading.Lock()
+        self.stats = {'provider': WaitStats(), 'tenant': WaitStats()}
+
+    def _tenant_bucket(self, tenant_id) -> Optional[TokenBucket]:
+        if self.tenant_rate <= 0 or tenant_id is None:
+            return None
+        with self._tenants_lock:
+            bucket = self._tenants.get(tenant_id)
+            if bucket is None:
+                bucket = TokenBucket(self.tenant_rate, self.tenant_burst)
+                self._tenants[tenant_id] = bucket
+            return bucket
+
+    def acquire(self, tenant_counts: Dict[Any, int]) -> float:
+        """
+        Wait until the given messages may be sent
+
+        Args:
+            tenant_counts: Number of messages per tenant (user id)
+
+        Returns:
+            Total seconds spent waiting
+        """
+        waited = 0.0
+        for tenant_id, count in tenant_counts.items():
+            bucket = self._tenant_bucket(tenant_id)
+            if bucket is not None:
+                wait = bucket.acquire(count)
+                self.stats['tenant'].record(count, wait)
+                waited += wait
+
+        if self.provider is not None:
+            total = sum(tenant_counts.values())
+            wait = self.provider.acquire(total)
+            self.stats['provider'].record(total, wait)
+            waited += wait
+
+        return waited
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'provider_rate': self.provider.rate if self.provider else None,
+            'tenant_rate': self.tenant_rate or None,
+            'tenants_tracked': len(self._tenants),
+            'wait': {name: stats.snapshot() for name, stats in self.stats.items()}
+        }
@@ -0,0 +1,96 @@
+"""
+Recurrence rules for appointment series
+
+Supports the subset of RFC 5545 RRULE that appointment series need:
+FREQ=DAILY|WEEKLY, INTERVAL, COUNT, UNTIL (YYYYMMDD) and, for weekly
+rules, BYDAY (MO,TU,...). Every rule must end with COUNT or UNTIL.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List
+
+# Largest number of occurrences one series may expand to
+MAX_OCCURRENCES = 52
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def parse_rule(rule: str) -> Dict[str, Any]:
+    """
+    Parse an RRULE string such as ``FREQ=WEEKLY;INTERVAL=2;COUNT=12``
+
+    Raises:
+        ValueError: If the rule is malformed or outside the supported subset
+    """
+    parts = {}
+    for part in (rule or '').upper().replace('RRULE:', '').split(';'):
+        if not part:
+            continue
+        name, _, value = part.partition('=')
+        if not value or name in parts:
+            raise ValueError(f"Invalid rule part: {part}")
+        parts[name] = value
+
+    unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY'}
+    if unsupported:
+        raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unsupported))}")
+    if parts.get('FREQ') not in ('DAILY', 'WEEKLY'):
+        raise ValueError("FREQ must be DAILY or WEEKLY")
+
+    parsed = {'freq': parts['FREQ'], 'interval': 1, 'count': None, 'until': None, 'byday': None}
+    try:
+        parsed['interval'] = int(parts.get('INTERVAL', 1))
+        if 'COUNT' in parts:
+            parsed['count'] = int(parts['COUNT'])
+        if 'UNTIL' in parts:
+            parsed['until'] = datetime.strptime(parts['UNTIL'][:8], '%Y%m%d').date()
+    except ValueError:
+        raise ValueError("INTERVAL, COUNT and UNTIL must be numbers and a YYYYMMDD date")
+    if parsed['interval'] < 1 or (parsed['count'] is not None and parsed['count'] < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+    if parsed['count'] is None and parsed['until'] is None:
+        raise ValueError("Rule must end with COUNT or UNTIL")
+
+    if 'BYDAY' in parts:
+        if parsed['freq'] != 'WEEKLY':
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        days = parts['BYDAY'].split(',')
+        if any(day not in WEEKDAYS for day in days):
+            raise ValueError(f"Invalid BYDAY: {parts['BYDAY']}")
+        parsed['byday'] = sorted({WEEKDAYS.index(day) for day in days})
+    return parsed
+
+
+def expand_rule(rule: str, start: date) -> List[date]:
+    """
+    Dates of a series starting at ``start``
+
+    Weekly rules without BYDAY repeat on the weekday of ``start``; with
+    BYDAY, days of the first week that fall before ``start`` are skipped.
+
+    Raises:
+        ValueError: If the rule is invalid or expands to more than
+            MAX_OCCURRENCES dates
+    """
+    parsed = parse_rule(rule)
+    count, until = parsed['count'], parsed['until']
+    if count is not None and count > MAX_OCCURRENCES:
+        raise ValueError(f"A series may have at most {MAX_OCCURRENCES} occurrences")
+
+    if parsed['freq'] == 'DAILY':
+        step, weekdays = timedelta(days=parsed['interval']), None
+    else:
+        step, weekdays = timedelta(weeks=parsed['interval']), parsed['byday'] or [start.weekday()]
+
+    dates = []
+    period = start if weekdays is None else start - timedelta(days=start.weekday())
+    while True:
+        candidates = [period] if weekdays is None else [period + timedelta(days=day) for day in weekdays]
+        for day in candidates:
+            if day < start:
+                continue
+            if (until is not None and day > until) or (count is not None and len(dates) >= count):
+                return dates
+            if len(dates) >= MAX_OCCURRENCES:
+                raise ValueError(f"A series may have at most {MAX_OCCURRENCES} occurrences")
+            dates.append(day)
+        period += step
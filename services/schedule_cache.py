@@ -0,0 +1,165 @@
+"""
+In-memory cache of a user's bookings for one day
+"""
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from models import Appointment, BlockedDay, NON_BLOCKING_STATUSES, db
+
+
+class DaySchedule:
+    """
+    Busy intervals and blocked flag of one user's day
+
+    ``busy`` holds (start_minute, end_minute, appointment_id, title) sorted
+    by start. ``max_end[i]`` is the latest end among busy[0..i], which lets
+    find_conflict() locate the first overlapping interval with two binary
+    searches.
+    """
+    __slots__ = ('version', 'busy', 'blocked', '_starts', '_max_end')
+
+    def __init__(self, version: int, busy: List[Tuple[int, int, int, str]], blocked: bool):
+        self.version = version
+        self.busy = busy
+        self.blocked = blocked
+        self._starts = [interval[0] for interval in busy]
+        self._max_end = []
+        latest = None
+        for interval in busy:
+            latest = interval[1] if latest is None else max(latest, interval[1])
+            self._max_end.append(latest)
+
+    def find_conflict(self, start_minute: int, end_minute: int,
+                      exclude_id: int = None) -> Optional[Tuple[int, int, int, str]]:
+        """First busy interval overlapping [start_minute, end_minute), if any"""
+        # Only intervals starting before end_minute can overlap ...
+        candidates = bisect_left(self._starts, end_minute)
+        # ... and the first one ending after start_minute is where max_end
+        # first exceeds start_minute
+        first = bisect_right(self._max_end, start_minute, 0, candidates)
+        for index in range(first, candidates):
+            interval = self.busy[index]
+            if interval[1] > start_minute and interval[2] != exclude_id:
+                return interval
+        return None
+
+
+class DayScheduleCache:
+    """
+    Thread-safe LRU cache of DaySchedule objects keyed by (user_id, date)
+
+    Entries are stamped with the user's schedule_version; an entry whose
+    version differs from the user row is reloaded, so writes made by other
+    processes are never served stale. Writes in this process also evict
+    the affected days right away (see the mapper events below).
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[int, Any], DaySchedule]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user, day) -> DaySchedule:
+        """
+        Schedule of a user's day
+
+        Args:
+            user: User object (its schedule_version validates the entry)
+            day: date
+        """
+        key = (user.id, day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == user.schedule_version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._load(user, day)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    @staticmethod
+    def _load(user, day) -> DaySchedule:
+        busy = [tuple(row) for row in db.session.query(
+            Appointment.start_minute, Appointment.end_minute, Appointment.id, Appointment.title
+        ).filter(
+            Appointment.user_id == user.id,
+            Appointment.appointment_date == day,
+            Appointment.status.notin_(NON_BLOCKING_STATUSES)
+        ).order_by(Appointment.start_minute.asc())]
+        blocked = BlockedDay.is_date_blocked(user.id, day)
+        return DaySchedule(user.schedule_version, busy, blocked)
+
+    def invalidate(self, user_id: int, day=None):
+        """Drop one day of a user, or all of the user's days"""
+        with self._lock:
+            if day is not None:
+                removed = self._entries.pop((user_id, day), None) is not None
+                self.invalidations += int(removed)
+                return
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+day_schedule_cache = DayScheduleCache(int(os.getenv('DAY_SCHEDULE_CACHE_SIZE', 2048)))
+
+
+def _changed_days(target, date_attribute):
+    """Current and previous (user_id, date) of a changed row"""
+    state = db.inspect(target)
+    keys = {(target.user_id, getattr(target, date_attribute))}
+    for attribute in ('user_id', date_attribute):
+        history = state.attrs[attribute].history
+        if history.deleted:
+            old_user = history.deleted[0] if attribute == 'user_id' else target.user_id
+            old_day = history.deleted[0] if attribute == date_attribute else getattr(target, date_attribute)
+            keys.add((old_user, old_day))
+    return keys
+
+
+@db.event.listens_for(Appointment, 'after_insert')
+@db.event.listens_for(Appointment, 'after_update')
+@db.event.listens_for(Appointment, 'after_delete')
+def _evict_appointment_day(mapper, connection, target):
+    for user_id, day in _changed_days(target, 'appointment_date'):
+        day_schedule_cache.invalidate(user_id, day)
+
+
+@db.event.listens_for(BlockedDay, 'after_insert')
+@db.event.listens_for(BlockedDay, 'after_update')
+@db.event.listens_for(BlockedDay, 'after_delete')
+def _evict_blocked_day(mapper, connection, target):
+    for user_id, day in _changed_days(target, 'date'):
+        day_schedule_cache.invalidate(user_id, day)
@@ -2,36 +2,126 @@
 Scheduler Service for managing appointment reminders
 """
 import os
+import pickle
+import time
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.job import Job
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.schedulers import SchedulerAlreadyRunningError
+from apscheduler.util import convert_to_datetime, datetime_to_utc_timestamp
+from sqlalchemy import select
+from services.sms_outbox import OutboxDispatcher, enqueue_reminder
 
 logger = logging.getLogger(__name__)
 
+# Seconds a late reminder is still delivered (shared by both modes)
+MISFIRE_GRACE_TIME = 300
+
+JOB_DEFAULTS = {
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': MISFIRE_GRACE_TIME  # 5 minutes
+}
+
+SWEEPER_JOB_ID = 'reminder_sweeper'
+RECONCILE_JOB_ID = 'reminder_reconcile'
+OUTBOX_JOB_ID = 'sms_outbox_dispatcher'
+SMS_ROLLUP_JOB_ID = 'sms_daily_rollup'
+REMINDER_JOB_PREFIX = 'reminder_'
+
+# Rows fetched per round trip when streaming appointments at startup
+RECONCILE_CHUNK_SIZE = 500
+
+# Service that owns the running scheduler; persisted jobs look it up here
+# because the service itself (db session, app) cannot be pickled
+_active_service = None
+
+
+def send_appointment_reminder(appointment_id: int):
+    """Entry point for per-appointment reminder jobs ('jobs' mode)"""
+    if _active_service is None:
+        logger.error(f"No active scheduler service, reminder for appointment {appointment_id} skipped")
+        return
+    _active_service._send_reminder_sms(appointment_id)
+
+
+class SharedEngineJobStore(SQLAlchemyJobStore):
+    """SQLAlchemy job store on the application's engine"""
+
+    def shutdown(self):
+        # The engine belongs to Flask-SQLAlchemy; disposing it here would
+        # drop the connection pool of the whole process
+        pass
+
+    def add_jobs(self, jobs):
+        """Store several jobs in one transaction, replacing jobs with the same ID"""
+        rows = [{
+            'id': job.id,
+            'next_run_time': datetime_to_utc_timestamp(job.next_run_time),
+            'job_state': pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        } for job in jobs]
+        if not rows:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(self.jobs_t.delete().where(self.jobs_t.c.id.in_([row['id'] for row in rows])))
+            connection.execute(self.jobs_t.insert(), rows)
+
+
 class SchedulerService:
-    """Service for managing appointment reminder scheduling"""
+    """Service for managing appointment reminder scheduling
+
+    Two reminder modes are supported (``REMINDER_MODE`` config):
+
+    - ``sweeper`` (default): a single recurring job periodically queries the
+      appointments whose reminder is due and sends them as one batch. The
+      appointment table is the source of truth, no job is stored per
+      appointment.
+    - ``jobs``: one persisted ``date`` job per appointment (legacy behaviour).
+    """
     
     def __init__(self, db, app):
         self.db = db
         self.app = app
         self.scheduler = None
+        self.jobstore = None
+        self.mode = app.config.get('REMINDER_MODE', 'sweeper')
+        self.sweep_interval = int(app.config.get('REMINDER_SWEEP_INTERVAL', 60))
+        self.reconcile_interval = int(app.config.get('REMINDER_RECONCILE_INTERVAL', 300))
+        self.outbox_interval = int(app.config.get('SMS_OUTBOX_INTERVAL', 10))
+        self.rollup_interval = int(app.config.get('SMS_ROLLUP_INTERVAL', 300))
+        self._last_sweep_at = None
+        self.outbox = OutboxDispatcher(
+            db, app,
+            batch_size=int(app.config.get('SMS_OUTBOX_BATCH_SIZE', 100)),
+            max_workers=int(app.config.get('SMS_OUTBOX_CONCURRENCY', 4)),
+            claim_timeout=int(app.config.get('SMS_OUTBOX_CLAIM_TIMEOUT', 0)),
+            max_attempts=int(app.config.get('SMS_OUTBOX_MAX_ATTEMPTS', 5)),
+            retry_base_delay=int(app.config.get('SMS_RETRY_BASE_DELAY', 60)),
+            retry_max_delay=int(app.config.get('SMS_RETRY_MAX_DELAY', 3600))
+        )
         self._setup_scheduler()
         
     def _setup_scheduler(self):
         """Setup APScheduler with SQLAlchemy job store"""
         try:
-            # Get Flask app instance path
-            db_path = os.path.join(self.app.instance_path, 'appointments.db')
-            db_url = f'sqlite:///{db_path}'
+            # The job store lives in the application database and shares
+            # its pooled engine instead of opening a second one
+            with self.app.app_context():
+                engine = self.db.engine
             
-            # Configure job store
+            # Configure job stores; recurring service jobs are re-registered
+            # on every start so they live in memory
+            self.jobstore = SharedEngineJobStore(engine=engine)
             jobstores = {
-                'default': SQLAlchemyJobStore(url=db_url)
+                'default': self.jobstore,
+                'memory': MemoryJobStore()
             }
             
             # Configure executors
@@ -39,18 +129,11 @@ class SchedulerService:
                 'default': ThreadPoolExecutor(max_workers=10)
             }
             
-            # Configure job defaults
-            job_defaults = {
-                'coalesce': True,
-                'max_instances': 1,
-                'misfire_grace_time': 300  # 5 minutes
-            }
-            
             # Create scheduler
             self.scheduler = BackgroundScheduler(
                 jobstores=jobstores,
                 executors=executors,
-                job_defaults=job_defaults,
+                job_defaults=JOB_DEFAULTS,
                 timezone='Europe/Istanbul'
             )
             
@@ -66,10 +149,18 @@ class SchedulerService:
     
     def start(self):
         """Start the scheduler"""
+        global _active_service
         try:
             if not self.scheduler.running:
+                _active_service = self
                 self.scheduler.start()
-                logger.info("Scheduler started successfully")
+                self._add_outbox_job()
+                self._add_rollup_job()
+                if self.mode == 'sweeper':
+                    self._add_sweeper_job()
+                else:
+                    self._add_reconcile_job()
+                logger.info(f"Scheduler started successfully (mode: {self.mode})")
             else:
                 logger.warning("Scheduler is already running")
         except SchedulerAlreadyRunningError:
@@ -80,12 +171,71 @@ class SchedulerService:
     
     def stop(self):
         """Stop the scheduler"""
+        global _active_service
         try:
             if self.scheduler and self.scheduler.running:
                 self.scheduler.shutdown(wait=True)
                 logger.info("Scheduler stopped successfully")
+            if _active_service is self:
+                _active_service = None
         except Exception as e:
             logger.error(f"Failed to stop scheduler: {str(e)}")
+
+    def _add_sweeper_job(self):
+        """Register the recurring reminder sweeper job"""
+        # Reminders that fell due while no scheduler was running are still
+        # sent if they are within the misfire grace time
+        self._last_sweep_at = None
+        self.scheduler.add_job(
+            func=self.sweep_due_reminders,
+            trigger='interval',
+            seconds=self.sweep_interval,
+            id=SWEEPER_JOB_ID,
+            name="Appointment reminder sweeper",
+            jobstore='memory',
+            next_run_time=datetime.now(self.scheduler.timezone),
+            replace_existing=True
+        )
+        logger.info(f"Reminder sweeper scheduled every {self.sweep_interval} seconds")
+    
+    def _add_outbox_job(self):
+        """Register the recurring SMS outbox dispatcher job"""
+        self.scheduler.add_job(
+            func=self.outbox.drain,
+            trigger='interval',
+            seconds=self.outbox_interval,
+            id=OUTBOX_JOB_ID,
+            name="SMS outbox dispatcher",
+            jobstore='memory',
+            replace_existing=True
+        )
+    
+    def _add_rollup_job(self):
+        """Register the recurring SMS usage rollup job"""
+        self.scheduler.add_job(
+            func=self.roll_up_sms_usage,
+            trigger='interval',
+            seconds=self.rollup_interval,
+            id=SMS_ROLLUP_JOB_ID,
+            name="SMS daily usage rollup",
+            jobstore='memory',
+            replace_existing=True
+        )
+    
+    def _add_reconcile_job(self):
+        """Register the recurring reconciliation job ('jobs' mode)"""
+        # Only the leader process owns a scheduler, so appointment changes
+        # made in other processes reach the job store through this job
+        self.scheduler.add_job(
+            func=self.schedule_all_pending_reminders,
+            trigger='interval',
+            seconds=self.reconcile_interval,
+            id=RECONCILE_JOB_ID,
+            name="Appointment reminder reconciliation",
+            jobstore='memory',
+            replace_existing=True
+        )
+        logger.info(f"Reminder reconciliation scheduled every {self.reconcile_interval} seconds")
     
     def schedule_appointment_reminder(self, appointment_id: int, reminder_time: datetime):
         """
@@ -95,22 +245,17 @@ class SchedulerService:
             appointment_id: ID of the appointment
             reminder_time: When to send the reminder
         """
+        if self.mode == 'sweeper':
+            # The sweeper picks the appointment up from the database
+            logger.debug(f"Sweeper mode, no job needed for appointment {appointment_id}")
+            return
+
         try:
-            job_id = f"reminder_{appointment_id}"
-            
             # Remove existing job if it exists
             self.remove_appointment_reminder(appointment_id)
             
             # Schedule new job
-            self.scheduler.add_job(
-                func=self._send_reminder_sms,
-                trigger='date',
-                run_date=reminder_time,
-                args=[appointment_id],
-                id=job_id,
-                name=f"Reminder for appointment {appointment_id}",
-                replace_existing=True
-            )
+            self._add_reminder_job(appointment_id, reminder_time)
             
             logger.info(f"Scheduled reminder for appointment {appointment_id} at {reminder_time}")
             
@@ -118,6 +263,67 @@ class SchedulerService:
             logger.error(f"Failed to schedule reminder for appointment {appointment_id}: {str(e)}")
             raise
     
+    def schedule_appointment_reminders(self, reminders: List[Tuple[int, datetime]]):
+        """
+        Schedule reminders for several appointments
+        
+        While the scheduler runs, all jobs are written in one job store
+        transaction; existing jobs of the same appointments are replaced.
+        
+        Args:
+            reminders: (appointment_id, reminder_time) pairs
+        """
+        if self.mode == 'sweeper':
+            logger.debug(f"Sweeper mode, no jobs needed for {len(reminders)} appointments")
+            return
+        
+        try:
+            if self.scheduler.running:
+                # One job store transaction for all reminders
+                self.jobstore.add_jobs([
+                    self._build_reminder_job(appointment_id, reminder_time)
+                    for appointment_id, reminder_time in reminders
+                ])
+                self.scheduler.wakeup()
+            else:
+                # Jobs added before start are queued by the scheduler itself
+                for appointment_id, reminder_time in reminders:
+                    self._add_reminder_job(appointment_id, reminder_time)
+            
+            logger.info(f"Scheduled {len(reminders)} reminders")
+            
+        except Exception as e:
+            logger.error(f"Failed to schedule {len(reminders)} reminders: {str(e)}")
+            raise
+    
+    def _add_reminder_job(self, appointment_id: int, reminder_time: datetime, replace_existing: bool = True):
+        """Add the persisted 'date' job for one appointment reminder"""
+        self.scheduler.add_job(
+            func=send_appointment_reminder,
+            trigger='date',
+            run_date=reminder_time,
+            args=[appointment_id],
+            id=f"{REMINDER_JOB_PREFIX}{appointment_id}",
+            name=f"Reminder for appointment {appointment_id}",
+            replace_existing=replace_existing
+        )
+    
+    def _build_reminder_job(self, appointment_id: int, reminder_time: datetime) -> Job:
+        """Same job as _add_reminder_job(), built for SharedEngineJobStore.add_jobs()"""
+        trigger = DateTrigger(run_date=reminder_time, timezone=self.scheduler.timezone)
+        return Job(
+            self.scheduler,
+            id=f"{REMINDER_JOB_PREFIX}{appointment_id}",
+            name=f"Reminder for appointment {appointment_id}",
+            func=send_appointment_reminder,
+            args=(appointment_id,),
+            kwargs={},
+            trigger=trigger,
+            executor='default',
+            next_run_time=trigger.get_next_fire_time(None, datetime.now(self.scheduler.timezone)),
+            **JOB_DEFAULTS
+        )
+    
     def remove_appointment_reminder(self, appointment_id: int):
         """
         Remove scheduled reminder for an appointment
@@ -126,7 +332,7 @@ class SchedulerService:
             appointment_id: ID of the appointment
         """
         try:
-            job_id = f"reminder_{appointment_id}"
+            job_id = f"{REMINDER_JOB_PREFIX}{appointment_id}"
             if self.scheduler.get_job(job_id):
                 self.scheduler.remove_job(job_id)
                 logger.info(f"Removed reminder for appointment {appointment_id}")
@@ -177,35 +383,23 @@ class SchedulerService:
                     logger.info(f"Appointment {appointment_id} is no longer scheduled, skipping reminder")
                     return
                 
-                # Get user and client
-                user = User.query.get(appointment.user_id)
-                client = Client.query.get(appointment.client_id) if appointment.client_id else None
+                if appointment.reminder_sent_at is not None:
+                    logger.info(f"Reminder for appointment {appointment_id} was already sent, skipping")
+                    return
                 
-                if not user:
+                if not appointment.user:
                     logger.error(f"User for appointment {appointment_id} not found")
                     return
                 
-                # Get SMS service
-                sms_service = get_sms_service()
-                
-                # Send reminder SMS
-                result = sms_service.send_reminder_sms(appointment, user, client)
-                
-                # Log SMS in database
-                sms_log = SmsLog(
-                    user_id=user.id,
-                    client_id=client.id if client else None,
-                    message=f"Reminder: {appointment.title} - {appointment.appointment_date} {appointment.appointment_time}",
-                    status=result['status'],
-                    error_message=result.get('error_message'),
-                    sms_provider=result.get('provider', 'unknown'),
-                    cost=result.get('cost', 0.0)
-                )
-                
-                self.db.session.add(sms_log)
+                # Queue the SMS and mark the reminder in one transaction
+                outbox = enqueue_reminder(self.db.session, appointment, get_sms_service())
+                appointment.reminder_sent_at = datetime.now()
                 self.db.session.commit()
                 
-                logger.info(f"Reminder SMS sent for appointment {appointment_id}: {result['status']}")
+                if outbox is not None:
+                    logger.info(f"Reminder SMS queued for appointment {appointment_id}")
+            
+            self.outbox.drain()
             
         except Exception as e:
             logger.error(f"Failed to send reminder SMS for appointment {appointment_id}: {str(e)}")
@@ -228,6 +422,96 @@ class SchedulerService:
                         self.db.session.commit()
             except:
                 pass
+
+    def roll_up_sms_usage(self, batch_size=10000):
+        """
+        Fold new sms_log rows into the daily usage rollups
+        
+        Returns:
+            Number of sms_log rows folded
+        """
+        from models import SmsDailyRollup
+
+        total = 0
+        try:
+            with self.app.app_context():
+                while True:
+                    folded = SmsDailyRollup.roll_up(batch_size)
+                    if not folded:
+                        break
+                    total += folded
+            if total:
+                logger.info(f"Rolled up {total} SMS log rows")
+        except Exception as e:
+            logger.error(f"SMS usage rollup failed: {str(e)}")
+            try:
+                with self.app.app_context():
+                    self.db.session.rollback()
+            except Exception:
+                pass
+        return total
+
+    def sweep_due_reminders(self):
+        """
+        Queue every unsent reminder that fell due since the previous sweep
+        
+        Runs as the recurring sweeper job. Due appointments are found with a
+        single range scan on the indexed reminder_due_at column; they are
+        marked as reminded and their outbox rows inserted in one commit,
+        then the outbox is drained.
+        
+        Returns:
+            Number of reminders queued
+        """
+        from services.sms_service import get_sms_service
+        from models import Appointment
+        from sqlalchemy.orm import joinedload
+
+        now = datetime.now()
+        grace_start = now - timedelta(seconds=MISFIRE_GRACE_TIME)
+        window_start = min(self._last_sweep_at, grace_start) if self._last_sweep_at else grace_start
+
+        try:
+            with self.app.app_context():
+                due = Appointment.query.options(
+                    joinedload(Appointment.user),
+                    joinedload(Appointment.client)
+                ).filter(
+                    Appointment.reminder_due_at > window_start,
+                    Appointment.reminder_due_at <= now,
+                    Appointment.reminder_sent_at.is_(None)
+                ).order_by(Appointment.reminder_due_at.asc()).all()
+
+                if not due:
+                    self._last_sweep_at = now
+                    return 0
+
+                sms_service = get_sms_service()
+                queued = 0
+                for appointment in due:
+                    appointment.reminder_sent_at = now
+                    if not appointment.user:
+                        logger.error(f"User for appointment {appointment.id} not found")
+                        continue
+                    if enqueue_reminder(self.db.session, appointment, sms_service) is not None:
+                        queued += 1
+
+                self.db.session.commit()
+                self._last_sweep_at = now
+
+            logger.info(f"Reminder sweep queued {queued} of {len(due)} due reminders"
+                        f" ({len(due) - queued} over quota or without user)")
+            self.outbox.drain()
+            return queued
+
+        except Exception as e:
+            logger.error(f"Reminder sweep failed: {str(e)}")
+            try:
+                with self.app.app_context():
+                    self.db.session.rollback()
+            except Exception:
+                pass
+            return 0
     
     def _job_executed(self, event):
         """Handle job execution events"""
@@ -248,42 +532,135 @@ class SchedulerService:
     def get_appointment_reminder_job(self, appointment_id: int):
         """Get reminder job for specific appointment"""
         try:
-            job_id = f"reminder_{appointment_id}"
+            job_id = f"{REMINDER_JOB_PREFIX}{appointment_id}"
             return self.scheduler.get_job(job_id)
         except Exception as e:
             logger.error(f"Failed to get reminder job for appointment {appointment_id}: {str(e)}")
             return None
     
-    def schedule_all_pending_reminders(self):
+    def schedule_all_pending_reminders(self, chunk_size: int = RECONCILE_CHUNK_SIZE) -> Dict[str, Any]:
         """
-        Schedule reminders for all pending appointments
+        Reconcile reminder jobs with the appointments table
         This should be called on application startup
+        
+        Appointments are streamed in chunks and diffed against the reminder
+        job IDs read from the job store in a single query, so only jobs that
+        are missing, moved or stale cause job store writes.
+        
+        Args:
+            chunk_size: Rows fetched per round trip while streaming
+            
+        Returns:
+            Dict with added, moved, unchanged and removed counts and the
+            elapsed time in seconds
         """
+        started = time.monotonic()
+        stats = {'added': 0, 'moved': 0, 'unchanged': 0, 'removed': 0}
+
         try:
-            from app import User, Appointment, BlockedDay, Client, SmsLog
-            
-            with self.app.app_context():
-                # Get all scheduled appointments that are in the future
-                now = datetime.now()
-                future_appointments = Appointment.query.filter(
-                    Appointment.status == 'scheduled',
-                    Appointment.appointment_date >= now.date()
-                ).all()
+            from models import Appointment
             
-                scheduled_count = 0
-                for appointment in future_appointments:
-                    appointment_datetime = appointment.get_datetime()
-                    
-                    # Calculate reminder time (24 hours before)
-                    reminder_time = appointment_datetime - timedelta(hours=24)
-                    
-                    # Only schedule if reminder time is in the future
-                    if reminder_time > now:
-                        self.schedule_appointment_reminder(appointment.id, reminder_time)
-                        scheduled_count += 1
-                
-                logger.info(f"Scheduled {scheduled_count} appointment reminders")
+            existing = self._load_reminder_job_index()
+
+            if self.mode == 'sweeper':
+                # The sweeper replaces per-appointment jobs entirely
+                stale = set(existing)
+            else:
+                with self.app.app_context():
+                    # Reminders still ahead, plus those within the misfire
+                    # grace time that the scheduler is about to run
+                    now = datetime.now()
+                    rows = self.db.session.query(
+                        Appointment.id,
+                        Appointment.reminder_due_at
+                    ).filter(
+                        Appointment.reminder_due_at > now - timedelta(seconds=MISFIRE_GRACE_TIME),
+                        Appointment.reminder_sent_at.is_(None)
+                    ).order_by(Appointment.id.asc()).yield_per(chunk_size)
+
+                    seen = set()
+                    for appointment_id, reminder_time in rows:
+                        job_id = f"{REMINDER_JOB_PREFIX}{appointment_id}"
+                        seen.add(job_id)
+                        run_timestamp = self._to_job_timestamp(reminder_time)
+                        current = existing.get(job_id)
+
+                        if job_id not in existing:
+                            self._add_reminder_job(appointment_id, reminder_time, replace_existing=False)
+                            stats['added'] += 1
+                        elif current is None or abs(current - run_timestamp) >= 1:
+                            self.scheduler.reschedule_job(job_id, trigger='date', run_date=reminder_time)
+                            stats['moved'] += 1
+                        else:
+                            stats['unchanged'] += 1
+
+                stale = set(existing) - seen
+
+            for job_id in stale:
+                self.scheduler.remove_job(job_id, jobstore='default')
+                stats['removed'] += 1
+
+            stats['elapsed_seconds'] = round(time.monotonic() - started, 3)
+            logger.info(
+                f"Reminder reconciliation ({self.mode}) finished in {stats['elapsed_seconds']}s: "
+                f"{stats['added']} added, {stats['moved']} moved, "
+                f"{stats['unchanged']} unchanged, {stats['removed']} removed"
+            )
+            return stats
                 
         except Exception as e:
             logger.error(f"Failed to schedule pending reminders: {str(e)}")
             raise
+
+    def _load_reminder_job_index(self) -> Dict[str, Optional[float]]:
+        """Map reminder job IDs to their next run timestamp without unpickling jobs"""
+        jobs_t = self.jobstore.jobs_t
+        query = select(jobs_t.c.id, jobs_t.c.next_run_time).where(
+            jobs_t.c.id.like(f"{REMINDER_JOB_PREFIX}%")
+        )
+        with self.jobstore.engine.connect() as connection:
+            return {
+                job_id: next_run_time
+                for job_id, next_run_time in connection.execute(query)
+                if job_id != SWEEPER_JOB_ID
+            }
+
+    def _to_job_timestamp(self, run_date: datetime) -> float:
+        """Convert a naive local run date to the job store's UTC timestamp"""
+        return datetime_to_utc_timestamp(
+            convert_to_datetime(run_date, self.scheduler.timezone, 'run_date')
+        )
+
+
+def run_worker():
+    """
+    Run the reminder engine as a standalone process
+    
+    Joins the leader election regardless of SCHEDULER_ROLE and blocks until
+    SIGINT/SIGTERM, so web processes can run with SCHEDULER_ROLE=off and
+    never load APScheduler.
+    """
+    import signal
+    import threading
+    from app import app, init_scheduler, shutdown_scheduler
+
+    stop_event = threading.Event()
+
+    def _handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping scheduler worker")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    logger.info(f"Scheduler worker starting (pid {os.getpid()})")
+    init_scheduler(role='worker')
+    try:
+        stop_event.wait()
+    finally:
+        shutdown_scheduler()
+        logger.info("Scheduler worker stopped")
+
+
+if __name__ == '__main__':
+    run_worker()
@@ -0,0 +1,359 @@
+"""
+Transactional SMS outbox and its dispatcher
+"""
+import logging
+import math
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+QUOTA_EXCEEDED_ERROR = 'Monthly SMS quota exceeded'
+
+def enqueue_reminder(session, appointment, sms_service):
+    """
+    Queue the reminder SMS of an appointment
+    
+    The row is only added to the session; committing it together with the
+    appointment change (e.g. reminder_sent_at) makes both durable at once.
+    One SMS of the user's monthly quota is reserved in the same transaction.
+    When the quota is used up the row is added dead-lettered instead, so
+    the skipped reminder shows up with the other dead letters and can be
+    replayed once quota is available.
+    
+    Args:
+        session: SQLAlchemy session of the surrounding transaction
+        appointment: Appointment object (user and client relations are used)
+        sms_service: SMS service used to build the message
+        
+    Returns:
+        The pending SmsOutbox row, or None if the user's SMS quota is used up
+    """
+    from models import SmsOutbox, SmsUsageMonthly
+
+    user = appointment.user
+    client = appointment.client
+    quota_month = SmsUsageMonthly.reserve(session.connection(), user.id, user.sms_quota)
+    reminder = sms_service.build_reminder(appointment, user, client)
+
+    outbox = SmsOutbox(
+        user_id=user.id,
+        client_id=client.id if client else None,
+        appointment_id=appointment.id,
+        phone=reminder['phone'],
+        message=reminder['message'],
+        log_message=f"Reminder: {appointment.title} - {appointment.appointment_date} {appointment.appointment_time}",
+        status='pending',
+        quota_month=quota_month
+    )
+    if quota_month is None:
+        logger.warning(f"SMS quota exceeded for user {user.id}, reminder for appointment {appointment.id} dead-lettered")
+        outbox.status = 'dead'
+        outbox.error_message = QUOTA_EXCEEDED_ERROR
+        session.add(outbox)
+        return None
+
+    session.add(outbox)
+    return outbox
+
+
+class OutboxDispatcher:
+    """
+    Drains pending outbox rows in batches
+    
+    Each batch is claimed (pending -> sending) in one UPDATE that tags the
+    rows with a token of its own, so concurrent drains (sweeper, outbox
+    job, jobs-mode reminders) never send the same row twice. The batch is
+    sent with at most ``max_workers`` concurrent provider calls, then
+    finalized together with its SmsLog rows in a single commit. Rows left
+    in 'sending' by a crashed dispatcher are put back to pending after the
+    claim timeout, so delivery is at-least-once. The timeout defaults to
+    twice the worst-case time to send a batch (provider timeouts, retries
+    and rate limit waits), so a slow batch is never re-queued while it is
+    still being sent.
+    
+    A retryable failure puts the row back to pending with ``next_attempt_at``
+    on an exponential backoff schedule. After ``max_attempts`` attempts, or
+    on a permanent failure, the row goes to the 'dead' (dead-letter) state
+    and is only sent again when an admin replays it.
+    """
+
+    def __init__(self, db, app, batch_size: int = 100, max_workers: int = 4, claim_timeout: int = 0,
+                 max_attempts: int = 5, retry_base_delay: int = 60, retry_max_delay: int = 3600):
+        self.db = db
+        self.app = app
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.claim_timeout = timedelta(seconds=claim_timeout) if claim_timeout else None
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    def drain(self, max_batches: int = None) -> Dict[str, int]:
+        """
+        Send pending SMS until the outbox is empty
+        
+        Args:
+            max_batches: Stop after this many batches (None: until empty)
+            
+        Returns:
+            Dict with sent, retrying and failed (dead-lettered) counts
+        """
+        from services.sms_service import get_sms_service
+
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        batches = 0
+        with self.app.app_context():
+            try:
+                sms_service = get_sms_service()
+                self._release_stale_claims(self.get_claim_timeout(sms_service))
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sms-outbox') as pool:
+                    while max_batches is None or batches < max_batches:
+                        rows = self._claim_batch()
+                        if not rows:
+                            break
+                        batches += 1
+                        counts = self._dispatch(rows, sms_service, pool)
+                        for key in totals:
+                            totals[key] += counts[key]
+            except Exception as e:
+                # Claimed rows are released again after claim_timeout
+                self.db.session.rollback()
+                logger.error(f"SMS outbox dispatch failed: {str(e)}")
+
+        if batches:
+            logger.info(f"SMS outbox drained in {batches} batch(es): {totals['sent']} sent, "
+                        f"{totals['retrying']} retrying, {totals['failed']} failed")
+        return totals
+
+    def get_claim_timeout(self, sms_service) -> timedelta:
+        """Age after which a claimed batch counts as abandoned"""
+        if self.claim_timeout:
+            return self.claim_timeout
+
+        # One provider request: every attempt may hit both timeouts, plus
+        # urllib3's backoff sleeps between the attempts
+        connect_timeout, read_timeout = getattr(sms_service, 'timeout', (5, 30))
+        retries = getattr(sms_service, 'max_retries', 0)
+        per_request = (connect_timeout + read_timeout) * (retries + 1) \
+            + getattr(sms_service, 'retry_backoff', 0) * 2 ** retries
+
+        # Same chunking as _dispatch: a pool thread works through its chunks
+        # one after another; a chunk is one bulk request, or one request per
+        # message without a bulk endpoint
+        chunk_size = self._chunk_size(sms_service)
+        chunks = math.ceil(self.batch_size / chunk_size)
+        requests_per_chunk = 1 if getattr(sms_service, 'bulk_api_url', None) else chunk_size
+        sending = math.ceil(chunks / self.max_workers) * requests_per_chunk * per_request
+
+        # All messages of a batch may belong to one tenant
+        rate_limiter = getattr(sms_service, 'rate_limiter', None)
+        rates = [rate for rate in (
+            rate_limiter.provider.rate if rate_limiter and rate_limiter.provider else 0,
+            rate_limiter.tenant_rate if rate_limiter else 0
+        ) if rate > 0]
+        waiting = self.batch_size / min(rates) if rates else 0
+        return timedelta(seconds=max(300, 2 * (sending + waiting)))
+
+    def _release_stale_claims(self, claim_timeout: timedelta):
+        from models import SmsOutbox
+
+        released = SmsOutbox.query.filter(
+            SmsOutbox.status == 'sending',
+            SmsOutbox.claimed_at < datetime.utcnow() - claim_timeout
+        ).update({'status': 'pending', 'claim_token': None}, synchronize_session=False)
+        self.db.session.commit()
+        if released:
+            logger.warning(f"Released {released} stale SMS outbox claims")
+
+    def _claim_batch(self) -> List:
+        from models import SmsOutbox
+
+        now = datetime.utcnow()
+        ids = [row_id for (row_id,) in self.db.session.query(SmsOutbox.id).filter(
+            SmsOutbox.status == 'pending',
+            self.db.or_(SmsOutbox.next_attempt_at.is_(None), SmsOutbox.next_attempt_at <= now)
+        ).order_by(SmsOutbox.id.asc()).limit(self.batch_size)]
+        if not ids:
+            return []
+
+        # Rows another drain claimed since the SELECT keep its token and
+        # are skipped here
+        token = uuid.uuid4().hex
+        SmsOutbox.query.filter(
+            SmsOutbox.id.in_(ids),
+            SmsOutbox.status == 'pending'
+        ).update({
+            'status': 'sending',
+            'claim_token': token,
+            'claimed_at': now,
+            'attempts': SmsOutbox.attempts + 1
+        }, synchronize_session=False)
+        self.db.session.commit()
+
+        return SmsOutbox.query.filter(
+            SmsOutbox.claim_token == token,
+            SmsOutbox.status == 'sending'
+        ).order_by(SmsOutbox.id.asc()).all()
+
+    def _dispatch(self, rows, sms_service, pool) -> Dict[str, int]:
+        from models import SmsLog, SmsUsageMonthly
+
+        # Provider calls run outside the session; only plain values are
+        # passed, one pool task per provider request
+        messages = [{
+            'phone_number': row.phone,
+            'message': row.message,
+            'user_id': row.user_id,
+            'client_id': row.client_id
+        } for row in rows]
+        chunk_size = self._chunk_size(sms_service)
+        batches = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+        results = [
+            result
+            for batch_results in pool.map(lambda batch: self._send(sms_service, batch), batches)
+            for result in batch_results
+        ]
+
+        now = datetime.utcnow()
+        counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+        sms_logs = []
+        releases = {}
+        for row, result in zip(rows, results):
+            row.claim_token = None
+            row.error_message = result.get('error_message')
+            row.sms_provider = result.get('provider', 'unknown')
+
+            if result['status'] not in ['sent', 'delivered'] and result.get('retryable', True) \
+                    and row.attempts < self.max_attempts:
+                # Not final yet; nothing is logged until the row settles
+                row.status = 'pending'
+                row.next_attempt_at = now + self._retry_delay(row.attempts)
+                counts['retrying'] += 1
+                continue
+
+            row.status = 'sent' if result['status'] in ['sent', 'delivered'] else 'dead'
+            row.provider_message_id = result.get('message_id')
+            row.cost = result.get('cost', 0.0)
+            row.sent_at = now if row.status == 'sent' else None
+            row.next_attempt_at = None
+            counts['sent' if row.status == 'sent' else 'failed'] += 1
+            if row.quota_month:
+                key = (row.user_id, row.quota_month)
+                releases[key] = releases.get(key, 0) + 1
+                row.quota_month = None
+
+            sms_logs.append(SmsLog(
+                user_id=row.user_id,
+                client_id=row.client_id,
+                message=row.log_message or row.message,
+                timestamp=now,
+                status=result['status'],
+                error_message=row.error_message,
+                sms_provider=row.sms_provider,
+                cost=row.cost
+            ))
+
+        # Reservations become sms_log rows (counted by the usage hook)
+        # in the same commit
+        connection = self.db.session.connection()
+        for (user_id, month), count in releases.items():
+            SmsUsageMonthly.release(connection, user_id, month, count)
+
+        self.db.session.add_all(sms_logs)
+        self.db.session.commit()
+        return counts
+
+    @staticmethod
+    def _chunk_size(sms_service) -> int:
+        """
+        Messages per pool task
+
+        With a bulk endpoint a task is one bulk request of the provider's
+        batch size; without one, send_many() sends message by message, so
+        every message gets a task of its own and the pool runs up to
+        max_workers of them at once.
+        """
+        if getattr(sms_service, 'bulk_api_url', None):
+            return max(1, getattr(sms_service, 'batch_size', 1))
+        return 1
+
+    def _retry_delay(self, attempts: int) -> timedelta:
+        # Exponential backoff with +/-10% jitter so rows that failed
+        # together do not all come back in the same batch
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** max(0, attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+    @staticmethod
+    def _send(sms_service, batch):
+        try:
+            return sms_service.send_many(batch)
+        except Exception as e:
+            return [{'status': 'failed', 'error_message': str(e), 'retryable': True,
+                     'cost': 0.0, 'provider': 'sms_provider'}] * len(batch)
+
+
+def replay_dead_letters(db, ids=None) -> Dict[str, int]:
+    """
+    Put dead-lettered SMS back into the outbox
+    
+    Every replayed SMS reserves quota again, exactly like a new reminder;
+    rows of users whose monthly quota is used up stay dead.
+    
+    Args:
+        db: SQLAlchemy instance
+        ids: Outbox row ids to replay (None: every dead row)
+        
+    Returns:
+        Dict with the replayed count and the count left dead by the quota
+    """
+    from models import SmsOutbox, SmsUsageMonthly, User
+
+    query = db.session.query(SmsOutbox.id, SmsOutbox.user_id, User.sms_quota).join(
+        User, User.id == SmsOutbox.user_id
+    ).filter(SmsOutbox.status == 'dead')
+    if ids is not None:
+        query = query.filter(SmsOutbox.id.in_(ids))
+
+    rows_by_user = {}
+    for row_id, user_id, quota in query.order_by(SmsOutbox.id.asc()):
+        rows_by_user.setdefault((user_id, quota), []).append(row_id)
+
+    connection = db.session.connection()
+    replay_ids = {}
+    over_quota = 0
+    for (user_id, quota), row_ids in rows_by_user.items():
+        # One reservation for all of the user's rows, row by row only
+        # when they do not all fit
+        month = SmsUsageMonthly.reserve(connection, user_id, quota or 0, count=len(row_ids))
+        if month is not None:
+            replay_ids.setdefault(month, []).extend(row_ids)
+            continue
+        for index, row_id in enumerate(row_ids):
+            month = SmsUsageMonthly.reserve(connection, user_id, quota or 0)
+            if month is None:
+                over_quota += len(row_ids) - index
+                break
+            replay_ids.setdefault(month, []).append(row_id)
+
+    replayed = 0
+    for month, row_ids in replay_ids.items():
+        replayed += SmsOutbox.query.filter(
+            SmsOutbox.id.in_(row_ids),
+            SmsOutbox.status == 'dead'
+        ).update({
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': None,
+            'claimed_at': None,
+            'claim_token': None,
+            'error_message': None,
+            'quota_month': month
+        }, synchronize_session=False)
+    db.session.commit()
+    if over_quota:
+        logger.warning(f"{over_quota} dead-lettered SMS not replayed, SMS quota exceeded")
+    return {'replayed': replayed, 'over_quota': over_quota}
@@ -2,13 +2,24 @@
 SMS Service for sending appointment reminders
 """
 import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
+from services.rate_limit import SmsRateLimiter
+from services.circuit_breaker import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+NO_PHONE_ERROR = 'No phone number available for reminder'
+CIRCUIT_OPEN_ERROR = 'SMS provider circuit is open'
+
+# Provider statuses that mean "try again later" rather than "rejected"
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
 class SMSService:
     """SMS service for sending appointment reminders"""
     
@@ -16,6 +27,58 @@ class SMSService:
         self.api_key = os.getenv('SMS_API_KEY')
         self.api_url = os.getenv('SMS_API_URL', 'https://api.sms-provider.com/send')
         self.sender_name = os.getenv('SMS_SENDER_NAME', 'Randevu Sistemi')
+        self.pool_size = int(os.getenv('SMS_POOL_SIZE', 10))
+        self.timeout = (
+            float(os.getenv('SMS_CONNECT_TIMEOUT', 5)),
+            float(os.getenv('SMS_READ_TIMEOUT', 30))
+        )
+        self.max_retries = int(os.getenv('SMS_MAX_RETRIES', 2))
+        self.retry_backoff = float(os.getenv('SMS_RETRY_BACKOFF', 0.5))
+        # Bulk endpoint; without it send_many falls back to one request per message
+        self.bulk_api_url = os.getenv('SMS_BULK_API_URL')
+        self.batch_size = max(1, int(os.getenv('SMS_BATCH_SIZE', 50)))
+        # Messages per second; sends over the limit wait instead of failing
+        self.rate_limiter = SmsRateLimiter(
+            provider_rate=float(os.getenv('SMS_RATE_LIMIT', 0)),
+            provider_burst=float(os.getenv('SMS_RATE_BURST', 10)),
+            tenant_rate=float(os.getenv('SMS_TENANT_RATE_LIMIT', 0)),
+            tenant_burst=float(os.getenv('SMS_TENANT_RATE_BURST', 5))
+        )
+        # Stop calling the provider after repeated failures
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('SMS_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('SMS_BREAKER_RESET_TIMEOUT', 30))
+        )
+        self.session = self._create_session()
+    
+    def _create_session(self) -> requests.Session:
+        """Create the keep-alive HTTP session shared by all sends"""
+        # Connection failures are always safe to retry; of the HTTP statuses
+        # only those where the provider did not accept the message
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            status_forcelist=(429, 502, 503),
+            allowed_methods=frozenset(['POST']),
+            backoff_factor=self.retry_backoff,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json; charset=utf-8'
+        })
+        return session
         
     def send_sms(self, phone_number: str, message: str, user_id: int, client_id: Optional[int] = None) -> Dict[str, Any]:
         """
@@ -30,6 +93,9 @@ class SMSService:
         Returns:
             Dict with status, message_id, and cost
         """
+        if not self.breaker.allow_request():
+            return self._failure(CIRCUIT_OPEN_ERROR)
+        
         try:
             # Clean phone number (remove spaces, add country code if needed)
             clean_phone = self._clean_phone_number(phone_number)
@@ -41,19 +107,15 @@ class SMSService:
                 'from': self.sender_name
             }
             
-            # Add API key to headers
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json; charset=utf-8'
-            }
+            self.rate_limiter.acquire({user_id: 1})
             
-            # Send SMS via API
-            response = requests.post(
+            # Send SMS via API (auth headers are set on the session)
+            response = self.session.post(
                 self.api_url,
                 json=sms_data,
-                headers=headers,
-                timeout=30
+                timeout=self.timeout
             )
+            self._record_response(response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
@@ -65,29 +127,154 @@ class SMSService:
                 }
             else:
                 logger.error(f"SMS API error: {response.status_code} - {response.text}")
-                return {
-                    'status': 'failed',
-                    'error_message': f"API error: {response.status_code}",
-                    'cost': 0.0,
-                    'provider': 'sms_provider'
-                }
+                return self._failure(
+                    f"API error: {response.status_code}",
+                    retryable=response.status_code in RETRYABLE_STATUS_CODES
+                )
                 
         except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
             logger.error(f"SMS request failed: {str(e)}")
-            return {
-                'status': 'failed',
-                'error_message': str(e),
-                'cost': 0.0,
-                'provider': 'sms_provider'
-            }
+            return self._failure(str(e))
         except Exception as e:
             logger.error(f"SMS service error: {str(e)}")
-            return {
-                'status': 'failed',
-                'error_message': str(e),
-                'cost': 0.0,
-                'provider': 'sms_provider'
+            return self._failure(str(e))
+        finally:
+            # A probe that failed before recording an outcome must not keep
+            # the circuit half-open forever
+            self.breaker.release()
+    
+    def send_many(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send several SMS messages, using the provider's bulk endpoint
+        
+        Args:
+            messages: Dicts with phone_number, message, user_id and
+                optional client_id
+            
+        Returns:
+            One result dict (as returned by send_sms) per message, in the
+            same order as the input
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        
+        # Messages without a number never reach the provider
+        sendable = []
+        for index, item in enumerate(messages):
+            if item.get('phone_number'):
+                sendable.append(index)
+            else:
+                results[index] = self._failure(NO_PHONE_ERROR, retryable=False)
+        
+        if not self.bulk_api_url:
+            for index in sendable:
+                item = messages[index]
+                results[index] = self.send_sms(
+                    item['phone_number'], item['message'], item['user_id'], item.get('client_id')
+                )
+            return results
+        
+        for start in range(0, len(sendable), self.batch_size):
+            chunk = sendable[start:start + self.batch_size]
+            chunk_results = self._send_bulk_request([messages[index] for index in chunk])
+            for index, result in zip(chunk, chunk_results):
+                results[index] = result
+        
+        return results
+    
+    def _send_bulk_request(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send one bulk request
+        
+        The provider answers with a ``results`` list in request order; each
+        entry carries message_id, status, cost and error for one message.
+        """
+        if not self.breaker.allow_request():
+            return [self._failure(CIRCUIT_OPEN_ERROR)] * len(messages)
+        
+        try:
+            payload = {
+                'from': self.sender_name,
+                'messages': [
+                    {'to': self._clean_phone_number(item['phone_number']), 'message': item['message']}
+                    for item in messages
+                ]
             }
+            tenant_counts = {}
+            for item in messages:
+                tenant_counts[item['user_id']] = tenant_counts.get(item['user_id'], 0) + 1
+            self.rate_limiter.acquire(tenant_counts)
+            
+            response = self.session.post(
+                self.bulk_api_url,
+                json=payload,
+                timeout=self.timeout
+            )
+            self._record_response(response.status_code)
+            
+            if response.status_code != 200:
+                logger.error(f"SMS bulk API error: {response.status_code} - {response.text}")
+                failure = self._failure(
+                    f"API error: {response.status_code}",
+                    retryable=response.status_code in RETRYABLE_STATUS_CODES
+                )
+                return [failure] * len(messages)
+            
+            entries = response.json().get('results') or []
+            results = []
+            for index in range(len(messages)):
+                if index >= len(entries):
+                    results.append(self._failure('Missing result in bulk response'))
+                    continue
+                entry = entries[index]
+                if entry.get('status', 'sent') in ['sent', 'accepted', 'queued', 'delivered']:
+                    results.append({
+                        'status': 'sent',
+                        'message_id': entry.get('message_id'),
+                        'cost': entry.get('cost', 0.0),
+                        'provider': 'sms_provider'
+                    })
+                else:
+                    results.append(self._failure(
+                        entry.get('error') or f"Provider status: {entry.get('status')}",
+                        retryable=False
+                    ))
+            return results
+        
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            logger.error(f"SMS bulk request failed: {str(e)}")
+            return [self._failure(str(e))] * len(messages)
+        except Exception as e:
+            logger.error(f"SMS service error: {str(e)}")
+            return [self._failure(str(e))] * len(messages)
+        finally:
+            self.breaker.release()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Rate limiter queue wait times and circuit breaker state"""
+        return {
+            'rate_limit': self.rate_limiter.get_metrics(),
+            'circuit_breaker': self.breaker.get_metrics()
+        }
+    
+    def _record_response(self, status_code: int):
+        # Rejections (4xx) prove the provider is up; only overload and
+        # server errors count against the circuit
+        if status_code in RETRYABLE_STATUS_CODES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+    
+    @staticmethod
+    def _failure(error_message: str, retryable: bool = True) -> Dict[str, Any]:
+        return {
+            'status': 'failed',
+            'error_message': error_message,
+            'retryable': retryable,
+            'cost': 0.0,
+            'provider': 'sms_provider'
+        }
     
     def _clean_phone_number(self, phone: str) -> str:
         """Clean and format phone number"""
@@ -133,9 +320,9 @@ Randevunuzu iptal etmek veya değiştirmek için lütfen bizimle iletişime geç
         # Ensure proper UTF-8 encoding
         return message.encode('utf-8').decode('utf-8')
     
-    def send_reminder_sms(self, appointment, user, client=None):
+    def build_reminder(self, appointment, user, client=None) -> Dict[str, Any]:
         """
-        Send reminder SMS for an appointment
+        Build recipient and text of the reminder SMS for an appointment
         
         Args:
             appointment: Appointment object
@@ -143,7 +330,7 @@ Randevunuzu iptal etmek veya değiştirmek için lütfen bizimle iletişime geç
             client: Client object (optional)
             
         Returns:
-            Dict with SMS sending result
+            Dict with phone (None if no number is available) and message
         """
         # Get recipient phone number
         if client and client.phone:
@@ -151,12 +338,7 @@ Randevunuzu iptal etmek veya değiştirmek için lütfen bizimle iletişime geç
         elif user.phone:
             phone_number = user.phone
         else:
-            return {
-                'status': 'failed',
-                'error_message': 'No phone number available for reminder',
-                'cost': 0.0,
-                'provider': 'sms_provider'
-            }
+            phone_number = None
         
         # Create reminder message
         message = self.create_reminder_message(
@@ -166,10 +348,28 @@ Randevunuzu iptal etmek veya değiştirmek için lütfen bizimle iletişime geç
             company_name=user.get_company_display_name()
         )
         
+        return {'phone': phone_number, 'message': message}
+    
+    def send_reminder_sms(self, appointment, user, client=None):
+        """
+        Send reminder SMS for an appointment
+        
+        Args:
+            appointment: Appointment object
+            user: User object (appointment owner)
+            client: Client object (optional)
+            
+        Returns:
+            Dict with SMS sending result
+        """
+        reminder = self.build_reminder(appointment, user, client)
+        if not reminder['phone']:
+            return self._failure(NO_PHONE_ERROR, retryable=False)
+        
         # Send SMS
         return self.send_sms(
-            phone_number=phone_number,
-            message=message,
+            phone_number=reminder['phone'],
+            message=reminder['message'],
             user_id=user.id,
             client_id=client.id if client else None
         )
@@ -188,10 +388,38 @@ class MockSMSService(SMSService):
             'cost': 0.1,
             'provider': 'mock_provider'
         }
+    
+    def send_many(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mock bulk sending - logs one line per batch"""
+        results = []
+        for start in range(0, len(messages), self.batch_size):
+            chunk = messages[start:start + self.batch_size]
+            logger.info(f"Mock bulk SMS batch of {len(chunk)} messages")
+            for item in chunk:
+                if not item.get('phone_number'):
+                    results.append(self._failure(NO_PHONE_ERROR, retryable=False))
+                    continue
+                results.append({
+                    'status': 'sent',
+                    'message_id': f'mock_{datetime.now().timestamp()}',
+                    'cost': 0.1,
+                    'provider': 'mock_provider'
+                })
+        return results
+
+
+_sms_service = None
+_sms_service_lock = threading.Lock()
 
 
 def get_sms_service():
-    """Get SMS service instance based on environment"""
-    if os.getenv('FLASK_ENV') == 'development' or not os.getenv('SMS_API_KEY'):
-        return MockSMSService()
-    return SMSService()
+    """Get the process-wide SMS service instance based on environment"""
+    global _sms_service
+    if _sms_service is None:
+        with _sms_service_lock:
+            if _sms_service is None:
+                if os.getenv('FLASK_ENV') == 'development' or not os.getenv('SMS_API_KEY'):
+                    _sms_service = MockSMSService()
+                else:
+                    _sms_service = SMSService()
+    return _sms_service
@@ -0,0 +1,144 @@
+"""
+Appointment statistics computed in grouped SQL
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import extract, func
+
+# extract('dow') is 0 for Sunday on both SQLite and Postgres
+SQL_DOW_TO_WEEKDAY = {0: 6, 1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: 5}
+
+
+@dataclass
+class AppointmentStatistics:
+    """Distributions of a user's appointments between two dates (inclusive)"""
+    start_date: date
+    end_date: date
+    total_count: int = 0
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    # (year, month, count) for every month of the range, oldest first
+    monthly: List[Tuple[int, int, int]] = field(default_factory=list)
+    # Appointments starting in each hour 0-23
+    hourly: List[int] = field(default_factory=lambda: [0] * 24)
+    # Appointments per weekday, Monday first
+    weekday: List[int] = field(default_factory=lambda: [0] * 7)
+    busiest_days: List[Tuple[date, int]] = field(default_factory=list)
+
+    def get_busiest_hours(self, limit: int = 10) -> List[Tuple[int, int]]:
+        """(hour, count) of the hours with appointments, busiest first"""
+        hours = [(hour, count) for hour, count in enumerate(self.hourly) if count]
+        return sorted(hours, key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def month_range(start_date: date, end_date: date) -> List[Tuple[int, int]]:
+    """(year, month) of every month touched by the range"""
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def get_monthly_status_counts(user_id: int, start_date: date,
+                              end_date: date) -> Dict[Tuple[int, int, str], int]:
+    """
+    Appointment counts per (year, month, status) within the range
+
+    Whole months come from appointment_rollup; only the days of a partial
+    first or last month are counted from the appointment table, so the
+    cost does not grow with the length of the range or the history.
+    """
+    from models import Appointment, AppointmentRollup, db
+
+    months = month_range(start_date, end_date)
+    full_months = [
+        (y, m) for y, m in months
+        if (y, m) != (start_date.year, start_date.month) or start_date.day == 1
+        if (y, m) != (end_date.year, end_date.month) or (end_date + timedelta(days=1)).day == 1
+    ]
+    full = set(full_months)
+
+    counts = {}
+    if full_months:
+        for month_key, status, count, _ in AppointmentRollup.get_monthly(
+                user_id, f'{full_months[0][0]:04d}-{full_months[0][1]:02d}',
+                f'{full_months[-1][0]:04d}-{full_months[-1][1]:02d}'):
+            y, m = int(month_key[:4]), int(month_key[5:])
+            if (y, m) in full and count:
+                counts[(y, m, status)] = counts.get((y, m, status), 0) + count
+
+    # Partial first/last month straight from the appointments of those days
+    partial = [(y, m) for y, m in months if (y, m) not in full]
+    for y, m in partial:
+        first = max(start_date, date(y, m, 1))
+        last = min(end_date, (date(y, m, 1) + timedelta(days=32)).replace(day=1) - timedelta(days=1))
+        for status, count in db.session.query(Appointment.status, func.count(Appointment.id)).filter(
+            Appointment.user_id == user_id,
+            Appointment.appointment_date >= first,
+            Appointment.appointment_date <= last
+        ).group_by(Appointment.status):
+            key = (y, m, status or 'pending')
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def get_appointment_statistics(user_id: int, start_date: date, end_date: date,
+                               busiest_days_limit: int = 10) -> AppointmentStatistics:
+    """
+    Status, monthly, hourly and weekday distributions of a user's appointments
+
+    Status and monthly counts come from the monthly rollup (see
+    get_monthly_status_counts); hourly, weekday and busiest-day figures
+    are one GROUP BY each over the (user_id, appointment_date) range. Only
+    EXTRACT and integer arithmetic are used, which SQLAlchemy renders for
+    both SQLite and Postgres; the hour comes from the stored start_minute
+    instead of formatting appointment_time.
+
+    Args:
+        user_id: Owner of the appointments
+        start_date: First day of the range
+        end_date: Last day of the range
+        busiest_days_limit: Number of busiest days to return
+    """
+    from models import Appointment, db
+
+    def grouped(*columns):
+        return db.session.query(*columns, func.count(Appointment.id)).filter(
+            Appointment.user_id == user_id,
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date
+        ).group_by(*columns)
+
+    statistics = AppointmentStatistics(start_date=start_date, end_date=end_date)
+
+    by_month = {}
+    for (y, m, status), count in get_monthly_status_counts(user_id, start_date, end_date).items():
+        by_month[(y, m)] = by_month.get((y, m), 0) + count
+        statistics.status_counts[status] = statistics.status_counts.get(status, 0) + count
+        statistics.total_count += count
+    statistics.monthly = [(y, m, by_month.get((y, m), 0)) for y, m in month_range(start_date, end_date)]
+
+    if not statistics.total_count:
+        return statistics
+
+    for hour, count in grouped(Appointment.start_minute // 60):
+        if hour is not None and 0 <= int(hour) < 24:
+            statistics.hourly[int(hour)] += count
+
+    for dow, count in grouped(extract('dow', Appointment.appointment_date)):
+        statistics.weekday[SQL_DOW_TO_WEEKDAY[int(dow)]] += count
+
+    count_column = func.count(Appointment.id)
+    statistics.busiest_days = [
+        (day, count) for day, count in db.session.query(Appointment.appointment_date, count_column).filter(
+            Appointment.user_id == user_id,
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date
+        ).group_by(Appointment.appointment_date).order_by(
+            count_column.desc(), Appointment.appointment_date.asc()
+        ).limit(busiest_days_limit)
+    ]
+    return statistics
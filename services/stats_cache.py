@@ -0,0 +1,247 @@
+"""
+Per-user cache of dashboard and statistics figures
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Appointment, BlockedDay, SmsLog, db
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'instance', 'stats_cache.db')
+
+
+class MemoryCacheBackend:
+    """Thread-safe LRU of pickled entries keyed by (user_id, name), local to the process"""
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[int, str], Tuple[float, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, user_id: int, name: str) -> Optional[Tuple[float, bytes]]:
+        with self._lock:
+            entry = self._entries.get((user_id, name))
+            if entry is not None:
+                self._entries.move_to_end((user_id, name))
+            return entry
+
+    def set(self, user_id: int, name: str, stored_at: float, value: bytes):
+        with self._lock:
+            self._entries[(user_id, name)] = (stored_at, value)
+            self._entries.move_to_end((user_id, name))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user_id]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    Entries in a SQLite file shared by all worker processes of a host
+
+    An invalidation in one worker deletes the user's rows for every worker.
+    Each thread keeps its own connection; WAL mode lets readers run while
+    another worker writes.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_entries: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS stats_cache ('
+            'user_id INTEGER NOT NULL, name TEXT NOT NULL, stored_at REAL NOT NULL, value BLOB NOT NULL, '
+            'PRIMARY KEY (user_id, name))'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, user_id: int, name: str) -> Optional[Tuple[float, bytes]]:
+        return self._connection().execute(
+            'SELECT stored_at, value FROM stats_cache WHERE user_id = ? AND name = ?', (user_id, name)
+        ).fetchone()
+
+    def set(self, user_id: int, name: str, stored_at: float, value: bytes):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO stats_cache (user_id, name, stored_at, value) VALUES (?, ?, ?, ?)',
+            (user_id, name, stored_at, value)
+        )
+        # Oldest entries go first once the file holds more than max_entries
+        excess = connection.execute('SELECT COUNT(*) FROM stats_cache').fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute(
+                'DELETE FROM stats_cache WHERE rowid IN '
+                '(SELECT rowid FROM stats_cache ORDER BY stored_at ASC LIMIT ?)', (excess,)
+            )
+            self.evictions += excess
+
+    def invalidate(self, user_id: int) -> int:
+        return self._connection().execute('DELETE FROM stats_cache WHERE user_id = ?', (user_id,)).rowcount
+
+    def clear(self):
+        self._connection().execute('DELETE FROM stats_cache')
+
+    def size(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM stats_cache').fetchone()[0]
+
+
+class StatsCache:
+    """
+    Computed per-user figures, dropped whenever one of the user's rows changes
+
+    Values are pickled, so callers always get their own copy and both
+    backends behave the same. ORM objects in a value are stored detached
+    with their loaded columns. ``ttl`` (seconds, 0 = none) bounds the age of
+    an entry in case a write bypasses the ORM events below.
+    """
+
+    def __init__(self, backend, ttl: float = 0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, user_id: int, name: str, compute: Callable[[], Any]) -> Any:
+        """
+        Cached value of ``name`` for a user, computed and stored on a miss
+
+        Args:
+            user_id: Owner of the figures
+            name: Entry name; include anything else the value depends on
+                (e.g. the current date)
+            compute: Called without arguments on a miss
+        """
+        entry = self.backend.get(user_id, name)
+        if entry is not None and (not self.ttl or time.time() - entry[0] < self.ttl):
+            with self._lock:
+                self.hits += 1
+            return pickle.loads(entry[1])
+
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        self.backend.set(user_id, name, time.time(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return value
+
+    def invalidate(self, user_id: int):
+        removed = self.backend.invalidate(user_id)
+        with self._lock:
+            self.invalidations += removed
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend.name,
+                'size': self.backend.size(),
+                'max_entries': self.backend.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                'evictions': self.backend.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+def _create_stats_cache() -> StatsCache:
+    """
+    Cache configured from STATS_CACHE_* settings
+
+    The default sqlite backend is shared by every process of a host, so a
+    write in any web worker or in the scheduler process invalidates the
+    entry for all of them. The memory backend only sees writes of its own
+    process; other processes' writes (SMS logs, outbox settles, bookings
+    served by another worker) reach it only through the TTL, which is
+    therefore short by default.
+    """
+    max_entries = int(os.getenv('STATS_CACHE_SIZE', 1024))
+    if os.getenv('STATS_CACHE_BACKEND', 'sqlite') == 'memory':
+        backend = MemoryCacheBackend(max_entries)
+        default_ttl = 60
+    else:
+        backend = SQLiteCacheBackend(os.getenv('STATS_CACHE_PATH') or DEFAULT_SQLITE_PATH, max_entries)
+        default_ttl = 3600
+    return StatsCache(backend, ttl=float(os.getenv('STATS_CACHE_TTL') or default_ttl))
+
+
+stats_cache = _create_stats_cache()
+
+
+def _changed_users(target):
+    """Current and previous user_id of a changed row"""
+    users = {target.user_id}
+    history = db.inspect(target).attrs['user_id'].history
+    users.update(history.deleted or ())
+    return users
+
+
+@db.event.listens_for(Appointment, 'after_insert')
+@db.event.listens_for(Appointment, 'after_update')
+@db.event.listens_for(Appointment, 'after_delete')
+@db.event.listens_for(BlockedDay, 'after_insert')
+@db.event.listens_for(BlockedDay, 'after_update')
+@db.event.listens_for(BlockedDay, 'after_delete')
+@db.event.listens_for(SmsLog, 'after_insert')
+@db.event.listens_for(SmsLog, 'after_update')
+@db.event.listens_for(SmsLog, 'after_delete')
+def _invalidate_user_stats(mapper, connection, target):
+    session = Session.object_session(target)
+    for user_id in _changed_users(target):
+        if user_id is None:
+            continue
+        stats_cache.invalidate(user_id)
+        # Another request may refill the entry from the old rows before
+        # this transaction commits; drop it once more after the commit
+        if session is not None:
+            session.info.setdefault('stats_cache_users', set()).add(user_id)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop('stats_cache_users', ()):
+        stats_cache.invalidate(user_id)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('stats_cache_users', None)
@@ -0,0 +1,98 @@
+"""
+Shared fixtures: the application on a throwaway SQLite database
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# Configure before app.py reads the environment. A temporary file rather
+# than an in-memory database, so that concurrent requests get connections
+# of their own and contend on SQLite's write lock like in production.
+_DB_DIR = tempfile.mkdtemp(prefix='randevu-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ['STATS_CACHE_BACKEND'] = 'memory'
+os.environ['SCHEDULER_ROLE'] = 'off'
+os.environ.pop('SMS_API_KEY', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db as _db, User  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    from services.schedule_cache import day_schedule_cache
+    from services.stats_cache import stats_cache
+
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        _db.create_all()
+    stats_cache.clear()
+    day_schedule_cache.clear()
+    yield flask_app
+    with flask_app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user and return its id"""
+    def make_user(username='egitmen', **fields):
+        with app.app_context():
+            user = User(
+                username=username,
+                email=f'{username}@example.com',
+                first_name='Test',
+                last_name='Egitmen',
+                phone='05321234567',
+                unique_link=f'{username}-link',
+                **fields
+            )
+            user.set_password('parola123')
+            _db.session.add(user)
+            _db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def login(app):
+    """Test client logged in as the given user id"""
+    def login(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return login
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager collecting the SQL statements run inside it"""
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = _db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return count_queries
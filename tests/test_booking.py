@@ -0,0 +1,80 @@
+"""
+Public booking under concurrent submissions
+"""
+import threading
+from datetime import date, timedelta
+
+from models import Appointment, User
+from services.availability import get_available_slots
+
+
+def _next_free_slot(app, user_id):
+    with app.app_context():
+        user = User.query.get(user_id)
+        start = date.today() + timedelta(days=1)
+        availability = get_available_slots(user, start, start + timedelta(days=13))
+    day = next(day for day in availability['days'] if day['slots'])
+    return day['date'], day['slots'][0]
+
+
+def _post_booking(client, unique_link, appointment_date, appointment_time, idempotency_key):
+    return client.post(f'/appointments/r/{unique_link}', data={
+        'name': 'Ayşe Yılmaz',
+        'phone': '05551112233',
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'idempotency_key': idempotency_key
+    })
+
+
+def test_concurrent_bookings_of_one_slot_create_one_appointment(app, make_user):
+    """40 different visitors submit the same slot at once; exactly one gets it"""
+    user_id = make_user()
+    appointment_date, appointment_time = _next_free_slot(app, user_id)
+
+    barrier = threading.Barrier(40)
+    statuses = []
+    errors = []
+
+    def submit(index):
+        try:
+            client = app.test_client()
+            barrier.wait()
+            response = _post_booking(client, 'egitmen-link', appointment_date, appointment_time, f'key-{index}')
+            statuses.append(response.status_code)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(statuses) == 40
+    with app.app_context():
+        assert Appointment.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_resubmitted_booking_form_creates_one_appointment(app, make_user):
+    user_id = make_user()
+    appointment_date, appointment_time = _next_free_slot(app, user_id)
+    client = app.test_client()
+
+    for _ in range(3):
+        _post_booking(client, 'egitmen-link', appointment_date, appointment_time, 'same-key')
+
+    with app.app_context():
+        assert Appointment.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_slot_outside_the_offered_grid_is_rejected(app, make_user):
+    user_id = make_user()
+    appointment_date, _ = _next_free_slot(app, user_id)
+
+    response = _post_booking(app.test_client(), 'egitmen-link', appointment_date, '23:37', 'late-key')
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert Appointment.query.filter_by(user_id=user_id).count() == 0
@@ -0,0 +1,68 @@
+"""
+Dashboard query budget
+"""
+from datetime import date, time, timedelta
+
+from models import Appointment
+
+
+def _add_appointments(db, user_id, days=30, per_day=3):
+    statuses = ['scheduled', 'completed', 'pending', 'cancelled']
+    for offset in range(-days // 2, days // 2):
+        for index in range(per_day):
+            db.session.add(Appointment(
+                user_id=user_id,
+                title=f'Ders {offset}/{index}',
+                appointment_date=date.today() + timedelta(days=offset),
+                appointment_time=time(9 + index * 2, 0),
+                duration=60,
+                status=statuses[(offset + index) % len(statuses)]
+            ))
+    db.session.commit()
+
+
+def _appointment_queries(statements):
+    return [statement for statement in statements if 'FROM appointment' in statement]
+
+
+def test_dashboard_query_count(app, db, make_user, login, count_queries):
+    """One aggregate query plus the today and upcoming lists, whatever the data size"""
+    user_id = make_user()
+    with app.app_context():
+        _add_appointments(db, user_id)
+    client = login(user_id)
+
+    with count_queries() as statements:
+        response = client.get('/dashboard/')
+
+    assert response.status_code == 200
+    assert len(_appointment_queries(statements)) == 3
+    # ... and the logged-in user, loaded once
+    assert len(statements) == 4
+
+
+def test_dashboard_served_from_cache(app, db, make_user, login, count_queries):
+    user_id = make_user()
+    with app.app_context():
+        _add_appointments(db, user_id)
+    client = login(user_id)
+    client.get('/dashboard/')
+
+    with count_queries() as statements:
+        response = client.get('/dashboard/')
+
+    assert response.status_code == 200
+    assert _appointment_queries(statements) == []
+
+
+def test_dashboard_cache_dropped_on_write(app, db, make_user, login, count_queries):
+    user_id = make_user()
+    client = login(user_id)
+    client.get('/dashboard/')
+
+    with app.app_context():
+        _add_appointments(db, user_id, days=2, per_day=1)
+    with count_queries() as statements:
+        client.get('/dashboard/')
+
+    assert len(_appointment_queries(statements)) == 3
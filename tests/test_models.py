@@ -0,0 +1,81 @@
+"""
+Model events
+"""
+from datetime import date, datetime, time, timedelta
+
+from models import Appointment, BlockedDay, User
+
+
+def test_schedule_changes_keep_user_updated_at(app, db, make_user):
+    user_id = make_user()
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        user.updated_at = datetime(2025, 1, 1, 12, 0)
+        db.session.commit()
+
+        appointment = Appointment(user_id=user_id, title='Ders', appointment_date=date.today() + timedelta(days=1),
+                                  appointment_time=time(10, 0), duration=60, status='scheduled')
+        db.session.add(appointment)
+        db.session.add(BlockedDay(user_id=user_id, date=date.today() + timedelta(days=2)))
+        db.session.commit()
+        appointment.appointment_time = time(11, 0)
+        db.session.commit()
+        db.session.delete(appointment)
+        db.session.commit()
+
+        db.session.expire_all()
+        user = db.session.get(User, user_id)
+        assert user.updated_at == datetime(2025, 1, 1, 12, 0)
+        assert user.schedule_version >= 4
+
+
+def _add_sms_logs(db, user_id, count, timestamp):
+    from models import SmsLog
+    for index in range(count):
+        db.session.add(SmsLog(user_id=user_id, message=f'Mesaj {index}', status='sent',
+                              cost=0.1, timestamp=timestamp))
+    db.session.commit()
+
+
+def test_usage_report_counts_each_sms_once(app, db, make_user):
+    from models import SmsDailyRollup
+
+    user_id = make_user()
+    with app.app_context():
+        timestamp = datetime.utcnow() - timedelta(hours=1)
+        _add_sms_logs(db, user_id, 5, timestamp)
+        SmsDailyRollup.roll_up()
+        _add_sms_logs(db, user_id, 3, timestamp)
+
+        usage, daily = SmsDailyRollup.get_usage_report(timestamp.date(), timestamp.date())
+
+        assert usage[0]['sms_count'] == 8
+        assert sum(day['count'] for day in daily) == 8
+
+
+def test_usage_report_consistent_when_rollup_commits_during_report(app, db, make_user, monkeypatch):
+    from models import SmsDailyRollup
+
+    user_id = make_user()
+    with app.app_context():
+        timestamp = datetime.utcnow() - timedelta(hours=1)
+        _add_sms_logs(db, user_id, 5, timestamp)
+        SmsDailyRollup.roll_up()
+        _add_sms_logs(db, user_id, 3, timestamp)
+
+        read_usage = SmsDailyRollup._read_usage
+        calls = []
+
+        def read_usage_racing_rollup(start_date, end_date, watermark):
+            if not calls:
+                # The rollup job folds the tail after the report read the watermark
+                SmsDailyRollup.roll_up()
+            calls.append(watermark)
+            return read_usage(start_date, end_date, watermark)
+
+        monkeypatch.setattr(SmsDailyRollup, '_read_usage', staticmethod(read_usage_racing_rollup))
+        usage, daily = SmsDailyRollup.get_usage_report(timestamp.date(), timestamp.date())
+
+        assert len(calls) == 2
+        assert usage[0]['sms_count'] == 8
+        assert sum(day['count'] for day in daily) == 8
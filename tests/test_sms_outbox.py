@@ -0,0 +1,105 @@
+"""
+SMS outbox dispatch
+"""
+import threading
+import time
+
+import services.sms_service as sms_service_module
+from models import SmsLog, SmsOutbox
+from services.sms_outbox import OutboxDispatcher
+
+
+class CountingSmsService:
+    """Mock provider recording how many send_many calls overlap"""
+
+    def __init__(self, bulk_api_url=None, batch_size=50, delay=0.02):
+        self.bulk_api_url = bulk_api_url
+        self.batch_size = batch_size
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def send_many(self, messages):
+        with self._lock:
+            self.calls.append(len(messages))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [{'status': 'sent', 'message_id': 'mock', 'cost': 0.0, 'provider': 'mock'}] * len(messages)
+
+
+def _queue_messages(app, db, user_id, count):
+    with app.app_context():
+        for index in range(count):
+            db.session.add(SmsOutbox(user_id=user_id, phone='05551112233',
+                                     message=f'Mesaj {index}', status='pending'))
+        db.session.commit()
+
+
+def test_messages_sent_in_parallel_without_bulk_endpoint(app, db, make_user, monkeypatch):
+    user_id = make_user()
+    _queue_messages(app, db, user_id, 20)
+    service = CountingSmsService()
+    monkeypatch.setattr(sms_service_module, 'get_sms_service', lambda: service)
+
+    totals = OutboxDispatcher(db, app, batch_size=20, max_workers=4).drain()
+
+    assert totals['sent'] == 20
+    assert service.calls == [1] * 20
+    assert service.max_active == 4
+    with app.app_context():
+        assert SmsLog.query.count() == 20
+
+
+def test_bulk_endpoint_gets_provider_sized_batches(app, db, make_user, monkeypatch):
+    user_id = make_user()
+    _queue_messages(app, db, user_id, 20)
+    service = CountingSmsService(bulk_api_url='https://sms.example.com/bulk', batch_size=5)
+    monkeypatch.setattr(sms_service_module, 'get_sms_service', lambda: service)
+
+    totals = OutboxDispatcher(db, app, batch_size=20, max_workers=4).drain()
+
+    assert totals['sent'] == 20
+    assert sorted(service.calls) == [5, 5, 5, 5]
+    assert service.max_active == 4
+
+
+def _worst_case_seconds(requests_per_thread, connect=5, read=30, retries=2, backoff=0.5):
+    """Every request times out on every attempt and sleeps the full backoff"""
+    return requests_per_thread * ((connect + read) * (retries + 1) + backoff * 2 ** retries)
+
+
+def test_claim_timeout_covers_worst_case_without_bulk_endpoint(app, db, monkeypatch):
+    monkeypatch.delenv('SMS_BULK_API_URL', raising=False)
+    service = sms_service_module.SMSService()
+    dispatcher = OutboxDispatcher(db, app, batch_size=100, max_workers=4)
+
+    # 100 single-message tasks over 4 threads: 25 requests in a row
+    worst_case = _worst_case_seconds(25)
+    assert dispatcher.get_claim_timeout(service).total_seconds() >= 2 * worst_case
+
+
+def test_claim_timeout_covers_worst_case_with_bulk_endpoint(app, db, monkeypatch):
+    monkeypatch.setenv('SMS_BULK_API_URL', 'https://sms.example.com/bulk')
+    monkeypatch.setenv('SMS_BATCH_SIZE', '10')
+    service = sms_service_module.SMSService()
+    dispatcher = OutboxDispatcher(db, app, batch_size=100, max_workers=4)
+
+    # 10 bulk requests over 4 threads: 3 requests in a row
+    worst_case = _worst_case_seconds(3)
+    assert dispatcher.get_claim_timeout(service).total_seconds() >= 2 * worst_case
+
+
+def test_claim_timeout_includes_rate_limit_wait(app, db, monkeypatch):
+    monkeypatch.setenv('SMS_BULK_API_URL', 'https://sms.example.com/bulk')
+    monkeypatch.setenv('SMS_RATE_LIMIT', '0.1')
+    service = sms_service_module.SMSService()
+    dispatcher = OutboxDispatcher(db, app, batch_size=100, max_workers=4)
+
+    # 100 messages at 0.1/s wait 1000s on top of the requests themselves
+    worst_case = _worst_case_seconds(1) + 1000
+    assert dispatcher.get_claim_timeout(service).total_seconds() >= 2 * worst_case